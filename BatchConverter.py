@@ -0,0 +1,69 @@
+# Standard imports
+import os, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+# Library imports
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+# Custom imports
+from Conversion import convertJob
+
+# Runs convertMat jobs in a process pool and hands the results back on the GUI thread
+
+class BatchConverter(QObject):
+    matConverted = pyqtSignal(str, object)      # Material ID, ConvertedMat (None if the job failed)
+    progress = pyqtSignal(int, int, str)        # Jobs done, total jobs, last material ID
+    finished = pyqtSignal(bool)                 # True if the batch was cancelled
+    def __init__(self, parent = None, maxWorkers = None):
+        super().__init__(parent)
+        self.maxWorkers = maxWorkers or os.cpu_count()
+        self.executor = None
+        self.futures = {}
+        self.doneCount = 0
+        self.totalCount = 0
+        self.errors = {}
+        self.pollTimer = QTimer(self)
+        self.pollTimer.setInterval(50)
+        self.pollTimer.timeout.connect(self.poll)
+    def isRunning(self):
+        return self.executor != None
+    def start(self, jobs):
+        # jobs is a list of (matID, texturePath, ConvertSettings, cacheDir) tuples
+        if self.isRunning(): return
+        self.futures.clear()
+        self.errors.clear()
+        self.doneCount = 0
+        self.totalCount = len(jobs)
+        if self.totalCount == 0:
+            self.finished.emit(False)
+            return
+        # Spawn rather than fork, forking a process that has Qt threads running can deadlock the children
+        spawnContext = multiprocessing.get_context('spawn')
+        self.executor = ProcessPoolExecutor(max_workers=min(self.maxWorkers, self.totalCount), mp_context=spawnContext)
+        for job in jobs:
+            self.futures[self.executor.submit(convertJob, job)] = job[0]
+        self.pollTimer.start()
+    def poll(self):
+        # Collect finished jobs on the GUI thread so results can be merged without locking
+        for future in [future for future in self.futures if future.done()]:
+            matID = self.futures.pop(future)
+            converted = None
+            if not future.cancelled():
+                try:
+                    converted = future.result()[1]
+                except Exception as error:
+                    self.errors[matID] = error
+            self.doneCount += 1
+            self.matConverted.emit(matID, converted)
+            self.progress.emit(self.doneCount, self.totalCount, matID)
+        if len(self.futures) == 0:
+            self.stop(False)
+    def cancel(self):
+        if not self.isRunning(): return
+        for future in self.futures:
+            future.cancel()
+        self.futures.clear()
+        self.stop(True)
+    def stop(self, cancelled):
+        self.pollTimer.stop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = None
+        self.finished.emit(cancelled)
@@ -0,0 +1,69 @@
+# Standard imports
+import os, time, json, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+# Custom imports
+from ModelExport import exportModelHeader, exportModelIndexed, exportModelBin, materialTable
+from BlobExport import exportModelBlob
+
+# Exports every object of a set of scenes in a process pool and writes a manifest of what was exported.
+# The material table holds everything the exporters need from the converted materials, so only it and the
+# object go to the workers, not the textures.
+
+EXPORTERS = {'header': exportModelHeader, 'indexed': exportModelIndexed, 'bin': exportModelBin, 'blob': exportModelBlob}
+HEADER_FORMATS = ('header', 'indexed', 'blob')     # All write data_model_{name}.h, so only one can be used at a time
+
+def safeName(name):
+    name = ''.join([char for char in name if char.isalnum()])
+    if not name or not name[0].isalpha(): name = "m" + name
+    return name
+def exportJob(job):
+    # Entry point for worker processes, job is a (sceneID, objID, obj, matTable, outputPath, outputName, formats) tuple
+    sceneID, objID, obj, matTable, outputPath, outputName, formats = job
+    start = time.perf_counter()
+    for exportFormat in formats:
+        primCount = EXPORTERS[exportFormat](obj, {}, outputPath, outputName, matTable)
+    return {'scene': sceneID, 'object': objID, 'name': outputName, 'formats': list(formats), 'prims': primCount,
+        'skippedPolys': len(obj.polys) - primCount, 'time': time.perf_counter() - start}
+def checkFormats(formats):
+    if len(formats) == 0: raise ValueError('No model export formats given')
+    for exportFormat in formats:
+        if exportFormat not in EXPORTERS: raise ValueError(f'Unknown model export format "{exportFormat}"')
+    headerFormats = [exportFormat for exportFormat in HEADER_FORMATS if exportFormat in formats]
+    if len(headerFormats) > 1: raise ValueError(f'Model export formats {", ".join(headerFormats)} all write the same header, pick one')
+def exportJobs(blenderData, convertedMats, outputPath, scenes = None, formats = ('header',)):
+    # One job per object, names are Scene_Object and get a number added if two objects end up the same
+    checkFormats(formats)
+    matTable = materialTable(convertedMats)
+    jobs = []
+    names = set()
+    for sceneID in blenderData.sceneIDs:
+        if scenes and sceneID not in scenes: continue
+        for objID in blenderData.sceneObjIDs[sceneID]:
+            outputName = baseName = f'{safeName(sceneID)}_{safeName(objID)}'
+            count = 1
+            while outputName in names:
+                count += 1
+                outputName = f'{baseName}{count}'
+            names.add(outputName)
+            jobs.append((sceneID, objID, blenderData.sceneObjs[sceneID][objID], matTable, outputPath, outputName, formats))
+    return jobs
+def exportScenes(blenderData, convertedMats, outputPath, scenes = None, formats = ('header',), workers = None, manifestName = 'models.json'):
+    # Returns the manifest, a list of per object results in scene order, and writes it next to the exports
+    jobs = exportJobs(blenderData, convertedMats, outputPath, scenes, formats)
+    workers = min(workers or os.cpu_count(), len(jobs))
+    start = time.perf_counter()
+    if workers <= 1:
+        results = [exportJob(job) for job in jobs]
+    else:
+        # Spawn rather than fork, forking a process that has Qt threads running can deadlock the children
+        spawnContext = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=spawnContext) as executor:
+            # A few chunks per worker so small objects don't pay a round trip each
+            results = list(executor.map(exportJob, jobs, chunksize=max(len(jobs) // (workers*4), 1)))
+    return writeManifest(results, formats, time.perf_counter() - start, outputPath, manifestName)
+def writeManifest(results, formats, exportTime, outputPath, manifestName = 'models.json'):
+    manifest = {'formats': list(formats), 'time': exportTime, 'prims': sum([result['prims'] for result in results]),
+        'skippedPolys': sum([result['skippedPolys'] for result in results]), 'objects': results}
+    with open(f'{outputPath}/{manifestName}', 'w') as manifestFile:
+        json.dump(manifest, manifestFile, indent=4)
+    return manifest
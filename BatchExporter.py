@@ -0,0 +1,66 @@
+# Standard imports
+import os, time, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+# Library imports
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+# Custom imports
+from BatchExport import exportJobs, exportJob, writeManifest
+
+# Runs exportJob jobs in a process pool and writes the manifest on the GUI thread once they are all done
+
+class BatchExporter(QObject):
+    progress = pyqtSignal(int, int, str)        # Jobs done, total jobs, last output name
+    finished = pyqtSignal(object)               # The manifest, None if the batch was cancelled
+    def __init__(self, parent = None, maxWorkers = None):
+        super().__init__(parent)
+        self.maxWorkers = maxWorkers or os.cpu_count()
+        self.executor = None
+        self.futures = {}
+        self.results = []
+        self.errors = {}
+        self.pollTimer = QTimer(self)
+        self.pollTimer.setInterval(50)
+        self.pollTimer.timeout.connect(self.poll)
+    def isRunning(self):
+        return self.executor != None
+    def start(self, blenderData, convertedMats, outputPath, scenes = None, formats = ('header',), manifestName = 'models.json'):
+        if self.isRunning(): return
+        jobs = exportJobs(blenderData, convertedMats, outputPath, scenes, formats)
+        self.futures.clear()
+        self.errors.clear()
+        self.results = [None]*len(jobs)
+        self.outputPath, self.formats, self.manifestName = outputPath, formats, manifestName
+        self.startTime = time.perf_counter()
+        if len(jobs) == 0:
+            self.finished.emit(writeManifest([], formats, 0, outputPath, manifestName))
+            return
+        # Spawn rather than fork, forking a process that has Qt threads running can deadlock the children
+        spawnContext = multiprocessing.get_context('spawn')
+        self.executor = ProcessPoolExecutor(max_workers=min(self.maxWorkers, len(jobs)), mp_context=spawnContext)
+        for index, job in enumerate(jobs):
+            self.futures[self.executor.submit(exportJob, job)] = (index, job[5])
+        self.pollTimer.start()
+    def poll(self):
+        # The manifest keeps the objects in scene order whatever order the jobs finish in
+        for future in [future for future in self.futures if future.done()]:
+            index, outputName = self.futures.pop(future)
+            if not future.cancelled():
+                try:
+                    self.results[index] = future.result()
+                except Exception as error:
+                    self.errors[outputName] = error
+            self.progress.emit(len(self.results) - len(self.futures), len(self.results), outputName)
+        if len(self.futures) == 0:
+            results = [result for result in self.results if result != None]
+            self.stop(writeManifest(results, self.formats, time.perf_counter() - self.startTime, self.outputPath, self.manifestName))
+    def cancel(self):
+        if not self.isRunning(): return
+        for future in self.futures:
+            future.cancel()
+        self.futures.clear()
+        self.stop(None)
+    def stop(self, manifest):
+        self.pollTimer.stop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = None
+        self.finished.emit(manifest)
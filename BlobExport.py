@@ -0,0 +1,83 @@
+# Custom imports
+from VRAMModel import encodeTexture, encodeCLUT
+from HeaderWriter import HeaderWriter
+from TextureExport import textureSymbol, writeTextureTable
+from ModelExport import modelRows, vertArray, primArray
+
+# Exports texture, CLUT and prim data as raw binary files instead of C initializer lists. Each export writes
+# a .bin with every array 4 byte aligned, an assembler stub that .incbins each array under its symbol and
+# a small header declaring the symbols with their sizes. Assemble the stub with the output directory on the
+# include path (as -I) and link it in place of the data headers.
+
+class BlobWriter:
+    def __init__(self, alignment = 4):
+        self.alignment = alignment
+        self.chunks = []
+        self.size = 0
+        self.symbols = []       # (symbol, section, offset, size)
+    def add(self, symbol, data, section = '.rodata'):
+        # Returns the offset of data in the blob
+        self.pad()
+        offset = self.size
+        self.chunks.append(data)
+        self.size += len(data)
+        self.symbols.append((symbol, section, offset, len(data)))
+        return offset
+    def alias(self, symbol, offset, size, section = '.rodata'):
+        # Another symbol with its own copy of data already in the blob
+        self.symbols.append((symbol, section, offset, size))
+    def pad(self):
+        padding = -self.size % self.alignment
+        if padding == 0: return
+        self.chunks.append(bytes(padding))
+        self.size += padding
+    def write(self, outputPath, blobName):
+        with open(f'{outputPath}/{blobName}.bin', 'wb') as blobFile:
+            blobFile.write(b''.join(self.chunks))
+        with open(f'{outputPath}/{blobName}.s', 'w') as stubFile:
+            stubFile.write(f'/* Symbols for the data in {blobName}.bin */\n')
+            for symbol, section, offset, size in self.symbols:
+                stubFile.write(f'\n.section {section}\n.balign {self.alignment}\n.global {symbol}\n.type {symbol}, @object\n.size {symbol}, {size}\n')
+                stubFile.write(f'{symbol}:\n.incbin "{blobName}.bin", {offset}, {size}\n')
+
+def exportTextureBlob(convertedMats, outputPath, outputName):
+    blob = BlobWriter()
+    textureFile = HeaderWriter(f'{outputPath}/data_textures_{outputName}.h')
+    textureFile.write(f"#ifndef texture_{outputName}_h\n#define texture_{outputName}_h\n")
+    textureFile.write('#include "types_gfx.h"\n\n')
+    for matName in convertedMats:
+        mat = convertedMats[matName]
+        if mat.type != 'T': continue
+        if not mat.packed: continue
+        safeName = textureSymbol(matName)
+        texture = encodeTexture(mat).astype('<u2')
+        blob.add(f'{safeName}_texture', texture.tobytes())
+        textureFile.write(f'extern unsigned short {safeName}_texture[{texture.size}];\n')
+        if not mat.packedCLUT: continue
+        clut = encodeCLUT(mat).astype('<u2')
+        blob.add(f'{safeName}_CLUT', clut.tobytes())
+        textureFile.write(f'extern unsigned short {safeName}_CLUT[{clut.size}];\n')
+    writeTextureTable(textureFile, convertedMats, outputName)
+    textureFile.close()
+    blob.write(outputPath, f'textures_{outputName}')
+def exportModelBlob(obj, convertedMats, outputPath, outputName, matTable = None):
+    # Returns the number of prims written
+    vertRows, primRows = modelRows(obj, convertedMats, matTable)
+    blob = BlobWriter()
+    blob.add(f'DAT_VERTNORMS_{outputName}', vertArray(vertRows).tobytes())
+    # The prims are double buffered, both buffers are filled from one copy in the blob and live in .data as
+    # the GPU ordering table links are written into them at runtime
+    prims = primArray(primRows).tobytes()
+    offset = blob.add(f'DAT_PRIMS_{outputName}_0', prims, '.data')
+    blob.alias(f'DAT_PRIMS_{outputName}_1', offset, len(prims), '.data')
+    blob.write(outputPath, f'model_{outputName}')
+    modelFile = HeaderWriter(f'{outputPath}/data_model_{outputName}.h')
+    modelFile.write(f"#ifndef prims_{outputName}_h\n#define prims_{outputName}_h\n")
+    modelFile.write('#include "types_gfx.h"\n\n')
+    modelFile.write(f'extern struct TriVertPack DAT_VERTNORMS_{outputName}[{len(vertRows)}];\n')
+    modelFile.write(f'extern struct PolyGT3Tiled DAT_PRIMS_{outputName}_0[{len(primRows)}];\n')
+    modelFile.write(f'extern struct PolyGT3Tiled DAT_PRIMS_{outputName}_1[{len(primRows)}];\n')
+    modelFile.write(f'\n#define PRIMS_LEN_{outputName} {len(primRows)}\n')
+    modelFile.write(f'#endif')
+    modelFile.close()
+    return len(primRows)
@@ -0,0 +1,169 @@
+# Standard imports
+import io, os, math, hashlib
+# Library imports
+from PIL import Image
+# Custom imports
+from ConvertedMat import ConvertedMat
+from TextureCache import TextureCache
+import TextureOps, Quantizer
+
+# Conversion of a single material without touching any Qt widgets, so it can be run in worker processes
+
+class ConvertSettings:
+    def __init__(self):
+        self.baseType = 'T'             # Prim type (options are F, G, T)
+        self.resize = False             # Flag to resize to xSize/ySize instead of clamping to 256x256
+        self.xSize = 64                 # Width to resize to
+        self.ySize = 64                 # Height to resize to
+        self.scaleType = 'N'            # Resize filter (options are N for nearest, B for bilinear)
+        self.removeBlack = True         # Flag to replace pure black with near black
+        self.colorMode = 15             # Texture pixel color format (options are 15, 8, 4)
+        self.generateCLUT = True        # Flag to generate a CLUT for indexed textures
+        self.dither = False             # Flag to dither indexed textures
+        self.ditherType = 'FS'          # Dither algorithm (options are FS for Floyd-Steinberg, ordered for 4x4 ordered)
+        self.tiled = False              # Flag to allow tiling during export
+        self.tileX = 8                  # Tiling width (MUST BE POWER OF 2!!!)
+        self.tileY = 8                  # Tiling height (MUST BE POWER OF 2!!!)
+        self.forceSemiTrans = False     # Flag to force semitrans during export
+    def __setstate__(self, state):
+        # Fill in attributes added since the save file was written
+        self.__init__()
+        self.__dict__.update(state)
+
+def preparePixels(textureImg, settings):
+    # Resizes and color adjusts a source image, returns (pixels, xSize, ySize, tpXSize)
+    # Indexed textures get an xSize of a whole number of VRAM halfwords, the pixels are padded up to it once
+    # the palette is built so the padding doesn't take up palette entries
+    textureImg = textureImg.convert("RGB")
+    ###################
+    # Size Adjustment #
+    ###################
+    scaleType = {'N': Image.NEAREST, 'B': Image.BILINEAR}[settings.scaleType]
+    if settings.resize:
+        xSize = settings.xSize
+        ySize = settings.ySize
+    else:
+        xSize, ySize = textureImg.size
+        # TODO Warning message the image is to big and had to be resized
+        if xSize > 256: xSize = 256
+        if ySize > 256: ySize = 256
+    pixels = TextureOps.imgToArray(textureImg.resize((xSize, ySize), scaleType))
+    ####################
+    # Color Adjustment #
+    ####################
+    if settings.removeBlack:
+        pixels = TextureOps.removeBlack(pixels)
+    if settings.colorMode == 15: return pixels, xSize, ySize, xSize
+    tpWidthScale = {4: 4, 8: 2}[settings.colorMode]
+    tpXSize = math.ceil(xSize/tpWidthScale)
+    return pixels, tpXSize*tpWidthScale, ySize, tpXSize
+def ditherType(settings):
+    return settings.ditherType if settings.dither else None
+def convertTexture(textureImg, settings):
+    # Does all the pixel work of a conversion, returns (textureImg, textureCLUT, xSize, ySize, tpXSize)
+    pixels, xSize, ySize, tpXSize = preparePixels(textureImg, settings)
+    textureCLUT = None
+    if settings.colorMode == 15:
+        textureImg = TextureOps.arrayToImg(TextureOps.truncate15BPP(pixels))
+    else:
+        colorCount = {4: 16, 8: 256}[settings.colorMode]
+        textureImg, texturePalImg = Quantizer.quantize(pixels, colorCount, ditherType(settings), xSize)
+        if settings.generateCLUT:
+            textureCLUT = texturePalImg
+    return textureImg, textureCLUT, xSize, ySize, tpXSize
+def convertMat(matID, texturePath, settings, cacheDir = None):
+    if settings.baseType == "F" or settings.baseType == "G":
+        converted = ConvertedMat()
+        converted.id = matID
+        converted.valid = True
+        converted.type = settings.baseType
+        converted.settings = settings
+        return converted
+    # TODO If no texture but a texture type is specified, show an error message
+    if texturePath == '': return None
+    textureMTime = os.path.getmtime(texturePath)
+    with open(texturePath, 'rb') as textureFile:
+        sourceBytes = textureFile.read()
+    # Reuse a previous conversion of the same image with the same settings if there is one
+    cache = None
+    entry = None
+    if cacheDir != None:
+        cache = TextureCache(cacheDir)
+        cacheKey = cache.key(sourceBytes, settings)
+        entry = cache.get(cacheKey)
+    if entry == None:
+        entry = convertTexture(Image.open(io.BytesIO(sourceBytes)), settings)
+        if cache != None: cache.put(cacheKey, entry)
+    textureImg, textureCLUT, xSize, ySize, tpXSize = entry
+    ##################################
+    # Creating Converted Texture Mat #
+    ##################################
+    converted = ConvertedMat()
+    # General Attributes
+    converted.id = matID
+    converted.valid = True
+    converted.type = settings.baseType
+    converted.settings = settings
+    # Texture Attributes
+    converted.origTexturePath = texturePath
+    converted.origTextureMTime = textureMTime
+    converted.origTextureHash = hashlib.sha256(sourceBytes).hexdigest()
+    converted.textureImg = textureImg
+    converted.xSize = xSize
+    converted.ySize = ySize
+    converted.tiled = settings.tiled
+    converted.tileX = settings.tileX
+    converted.tileY = settings.tileY
+    converted.forceSemiTrans = settings.forceSemiTrans
+    converted.colorMode = settings.colorMode
+    converted.tpXSize = tpXSize
+    # CLUT Attributes
+    converted.textureCLUT = textureCLUT
+    return converted
+def convertJob(job):
+    # Entry point for worker processes, job is a (matID, texturePath, settings, cacheDir) tuple
+    matID, texturePath, settings, cacheDir = job
+    return matID, convertMat(matID, texturePath, settings, cacheDir)
+def fileHash(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as hashFile:
+        for chunk in iter(lambda: hashFile.read(1024*1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+def isStale(converted, blenderMat):
+    # Checks if the original a material was converted from has changed since
+    if blenderMat == None: return True
+    if converted.type != 'T': return False
+    if blenderMat.texturePath != converted.origTexturePath: return True
+    if not os.path.exists(converted.origTexturePath): return True
+    textureMTime = os.path.getmtime(converted.origTexturePath)
+    if converted.origTextureHash == None:
+        # Saved before the original was tracked, nothing to compare against so take the file as it is now
+        converted.origTextureMTime = textureMTime
+        converted.origTextureHash = fileHash(converted.origTexturePath)
+        return False
+    if textureMTime == converted.origTextureMTime: return False
+    # Only hash the file when the mtime moved, a touched but identical file is still valid
+    if fileHash(converted.origTexturePath) != converted.origTextureHash: return True
+    converted.origTextureMTime = textureMTime
+    return False
+def invalidateStale(blenderData, convertedMats):
+    # Flags converted mats whose originals changed as invalid, returns the IDs of all invalid mats
+    staleIDs = []
+    for matID, converted in convertedMats.items():
+        if converted.valid and isStale(converted, blenderData.mats.get(matID)):
+            converted.valid = False
+        if not converted.valid:
+            staleIDs.append(matID)
+    return staleIDs
+def carryPacking(oldMat, newMat):
+    # Keep the VRAM placement of a reconverted material if it still takes up the same space
+    if oldMat == None or oldMat.type != 'T' or newMat.type != 'T': return
+    if (oldMat.tpXSize, oldMat.ySize, oldMat.colorMode) != (newMat.tpXSize, newMat.ySize, newMat.colorMode): return
+    newMat.packed = oldMat.packed
+    newMat.xPos = oldMat.xPos
+    newMat.yPos = oldMat.yPos
+    if newMat.textureCLUT == None: return
+    newMat.packedCLUT = oldMat.packedCLUT
+    newMat.xPosCLUT = oldMat.xPosCLUT
+    newMat.yPosCLUT = oldMat.yPosCLUT
@@ -4,8 +4,12 @@ class ConvertedMat:
         self.id = ""                    # Blender Mat Name
         self.valid = False              # Flag if material is still in sync with Blender
         self.type = None                # Flag to set the prim type (flat, gourad or textured)
+        self.settings = None            # ConvertSettings snapshot the material was converted with
+        self.generation = 0             # Bumped every time the converted pixels change, used to invalidate previews
         # Texture Map Attributes
         self.origTexturePath = ""       # File path to original texture image
+        self.origTextureMTime = None    # Modification time of the original texture when it was converted
+        self.origTextureHash = None     # SHA-256 of the original texture file when it was converted
         self.textureImg = None          # Pillow image object of the converted texture
         self.xSize = None               # Width of converted texture
         self.ySize = None               # Height of converted texture
@@ -16,6 +20,8 @@ class ConvertedMat:
         self.colorMode = None           # Texture pixel color format (options are 15, 8, 4)
         self.tpXSize = None             # Width of converted texture in VRAM
         self.packed = False             # Flag if texture has been packed into VRAM
+        self.textureHash = None         # Content hash of the converted texture, set when deduplicating
+        self.textureAlias = None        # ID of the material with an identical texture this material shares VRAM with
         self.xPos = 640                 # X position of texture in VRAM
         self.yPos = 0                   # Y position of texture in VRAM
         # CLUT Attributes
@@ -23,6 +29,8 @@ class ConvertedMat:
         self.packedCLUT = False         # Flag if the CLUT has been packed into VRAM
         self.xPosCLUT = 0               # X position of the CLUT in VRAM
         self.yPosCLUT = 0               # Y position of the CLUT in VRAM
+        self.clutGroup = None           # ID of the shared CLUT group the material is in (None if not shared)
+        self.clutOwner = None           # ID of the material whose CLUT this material uses (None if it uses its own)
         # Normal Map Attributes
         self.origNormalPath = ""        # File path to original normal map image
         self.normalImg = None           # Pillow image object of the converted normal map
@@ -30,3 +38,7 @@ class ConvertedMat:
         self.packedNorm = False         # Flag if normal map has been packed into VRAM
         self.xPosNorm = 0               # X position of normal map in VRAM
         self.yPosNorm = 0               # X position of normal map in VRAM
+    def __setstate__(self, state):
+        # Fill in attributes added since the save file was written
+        self.__init__()
+        self.__dict__.update(state)
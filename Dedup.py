@@ -0,0 +1,65 @@
+# Standard imports
+import hashlib
+# Custom imports
+from PaletteSharing import clutSource
+
+# Finds converted textures and CLUTs with identical contents so they are packed and exported once. A
+# duplicate texture points at the material it shares VRAM with through textureAlias. Duplicate CLUTs are
+# merged into one CLUT group, the same way PaletteSharing shares them.
+
+def textureSource(convertedMats, mat):
+    # Returns the material holding the VRAM copy of a material's texture
+    if mat.textureAlias == None: return mat
+    owner = convertedMats.get(mat.textureAlias)
+    if owner == None or owner.textureHash != mat.textureHash: return mat
+    return owner
+def textureHash(mat):
+    hasher = hashlib.sha256(repr((mat.colorMode, mat.xSize, mat.ySize, mat.tpXSize, mat.textureImg.mode)).encode())
+    # Only the pixel data goes to VRAM, indexed textures with different palettes still share a slot
+    hasher.update(mat.textureImg.tobytes())
+    return hasher.hexdigest()
+def clutHash(mat):
+    hasher = hashlib.sha256(repr(mat.colorMode).encode())
+    hasher.update(mat.textureCLUT.tobytes())
+    return hasher.hexdigest()
+def dedupTextures(convertedMats, keepPacked = False):
+    # Returns the number of texture and CLUT copies that no longer need their own VRAM space. With keepPacked
+    # a copy that is already packed owns the VRAM slot, so packed items are never unpacked in favor of one
+    # that isn't.
+    textureOwners = {}
+    textureDupes = 0
+    for matID, mat in convertedMats.items():
+        if mat.type != 'T' or mat.textureImg == None: continue
+        mat.textureHash = textureHash(mat)
+        if keepPacked and mat.packed: textureOwners.setdefault(mat.textureHash, mat)
+    for matID, mat in convertedMats.items():
+        if mat.type != 'T' or mat.textureImg == None: continue
+        owner = textureOwners.setdefault(mat.textureHash, mat)
+        if owner is mat:
+            mat.textureAlias = None
+            continue
+        mat.textureAlias = owner.id
+        mat.packed = False
+        textureDupes += 1
+    clutOwners = {}
+    clutDupes = 0
+    if keepPacked:
+        for matID, mat in convertedMats.items():
+            if mat.type != 'T' or mat.textureCLUT == None or not mat.packedCLUT: continue
+            if clutSource(convertedMats, mat) is not mat: continue
+            clutOwners.setdefault(clutHash(mat), mat)
+    for matID, mat in convertedMats.items():
+        if mat.type != 'T' or mat.textureCLUT == None: continue
+        if clutSource(convertedMats, mat) is not mat: continue
+        owner = clutOwners.setdefault(clutHash(mat), mat)
+        if owner is mat: continue
+        # Fold this CLUT (and anything already sharing it) into the owner's group
+        if owner.clutGroup == None: owner.clutGroup = owner.id
+        oldGroup = mat.clutGroup
+        for member in convertedMats.values():
+            if member is mat or (oldGroup != None and member.clutGroup == oldGroup):
+                member.clutGroup = owner.clutGroup
+                member.clutOwner = owner.id
+        mat.packedCLUT = False
+        clutDupes += 1
+    return textureDupes, clutDupes
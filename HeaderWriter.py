@@ -0,0 +1,30 @@
+# Library imports
+import numpy as np
+
+# Buffered writer for the generated C headers. Arrays are formatted a chunk at a time with str.join and
+# str.format doing the per value work, so big textures and meshes are never built up as one string or
+# written a value at a time.
+
+class HeaderWriter:
+    def __init__(self, path, chunkSize = 16384, bufferSize = 1024*1024):
+        self.file = open(path, 'w', buffering=bufferSize)
+        self.chunkSize = chunkSize
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+    def write(self, text):
+        self.file.write(text)
+    def writeValues(self, values):
+        # Writes every value followed by ', ' on the current line
+        values = np.asarray(values).ravel()
+        for start in range(0, len(values), self.chunkSize):
+            self.file.write(', '.join([str(value) for value in values[start:start+self.chunkSize].tolist()]) + ', ')
+    def writeRows(self, rows, rowFormat):
+        # Writes rowFormat.format(*row) for every row of a 2D array or list of sequences
+        for start in range(0, len(rows), self.chunkSize):
+            chunk = rows[start:start+self.chunkSize]
+            if isinstance(chunk, np.ndarray): chunk = chunk.tolist()
+            self.file.write(''.join([rowFormat.format(*row) for row in chunk]))
+    def close(self):
+        self.file.close()
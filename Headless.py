@@ -0,0 +1,165 @@
+# Standard imports
+import os, sys, time, json, pickle, argparse
+from concurrent.futures import ProcessPoolExecutor
+# Custom imports
+from BlenderState import BlenderState
+from Conversion import ConvertSettings, convertJob, carryPacking
+from PaletteSharing import clutGroups, restoreCLUTGroups, repairCLUTGroups
+from VRAMLayout import VRAMSettings, VRAMLayout, describeGain, describeTrials
+from TextureExport import exportTextureBin, exportTextureHeader, exportTextureArchive
+from VRAMModel import VRAMModel
+from BlobExport import exportTextureBlob
+from BatchExport import exportScenes
+
+# Runs the convert, pack and export pipeline on a saved project without starting the GUI or importing Qt
+#
+# Usage: python Headless.py --mats saveFile.pkl --blender blenderState.pkl --output ./build
+#
+# The optional --settings JSON file can hold:
+#   "vram":    VRAMSettings fields for the framebuffer setup
+#   "default": ConvertSettings fields for materials that have never been converted
+#   "mats":    {matName: ConvertSettings fields} overriding the settings of single materials
+
+def applyFields(target, fields):
+    for key, value in fields.items():
+        if not hasattr(target, key):
+            raise ValueError(f'Unknown setting "{key}" for {type(target).__name__}')
+        setattr(target, key, value)
+    return target
+def matSettings(matID, convertedMats, pipelineSettings):
+    # Per material overrides on top of the settings it was last converted with (or the defaults)
+    settings = None
+    if matID in convertedMats and convertedMats[matID].settings != None:
+        settings = pickle.loads(pickle.dumps(convertedMats[matID].settings))
+    elif 'default' in pipelineSettings:
+        settings = applyFields(ConvertSettings(), pipelineSettings['default'])
+    if matID in pipelineSettings.get('mats', {}):
+        if settings == None: settings = ConvertSettings()
+        applyFields(settings, pipelineSettings['mats'][matID])
+    return settings
+class StageTimer:
+    def __init__(self):
+        self.timings = {}
+    def run(self, name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.timings[name] = time.perf_counter() - start
+        print(f'{name:<16}{self.timings[name]*1000:10.1f} ms')
+        return result
+def convertAll(blenderData, convertedMats, pipelineSettings, cacheDir, workers):
+    jobs = []
+    for matID in blenderData.matIDs:
+        settings = matSettings(matID, convertedMats, pipelineSettings)
+        if settings == None: continue
+        jobs.append((matID, blenderData.mats[matID].texturePath, settings, cacheDir))
+    # Reconverting gives every material its own palette again, the saved CLUT sharing is put back after
+    jobIDs = set([job[0] for job in jobs])
+    groups = {groupID: matIDs for groupID, matIDs in clutGroups(convertedMats).items() if jobIDs & set(matIDs)}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(convertJob, job) for job in jobs]
+        # Results are merged in job order so the BIN and headers come out in the same order every run
+        for future, job in zip(futures, jobs):
+            try:
+                matID, converted = future.result()
+            except Exception as error:
+                print(f'Failed to convert {job[0]}: {error}')
+                continue
+            if converted == None: continue
+            carryPacking(convertedMats.get(matID), converted)
+            convertedMats[matID] = converted
+    restoreCLUTGroups(convertedMats, groups)
+    repairCLUTGroups(convertedMats)
+    return len(jobs)
+def packAll(convertedMats, vramSettings, strategy, compare, budget, workers):
+    if strategy == 'incremental':
+        # Keep the saved positions and only place new or resized items
+        layout = VRAMLayout(convertedMats, vramSettings)
+        failed = layout.autoPackUnpacked()
+        for matID, itemType in layout.movedItems:
+            print(f'Moved to make room: {itemType} {matID}')
+        return failed
+    for mat in convertedMats.values():
+        mat.packed = False
+        mat.packedCLUT = False
+    layout = VRAMLayout(convertedMats, vramSettings)
+    if not compare:
+        failed = layout.autoPackAll(strategy, budget=budget, workers=workers)
+    else:
+        failed, stats, baseFailed, baseStats = layout.comparePacking(strategy, budget=budget, workers=workers)
+        print(f'{strategy}: {len(failed)} items did not fit (first-fit {len(baseFailed)}), {describeGain(stats, baseStats)}')
+    if strategy == 'optimize': print(describeTrials(layout.trials))
+    return failed
+def dumpVRAM(convertedMats, path):
+    vramModel = VRAMModel()
+    vramModel.sync(convertedMats)
+    vramModel.dump(path)
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='Convert, pack and export a PSXport project without the GUI')
+    parser.add_argument('--mats', default='./saveFile.pkl', help='Converted materials saved by the GUI')
+    parser.add_argument('--blender', default='./blenderState.pkl', help='Blender state saved by the GUI')
+    parser.add_argument('--settings', help='JSON file with VRAM and per material conversion settings')
+    parser.add_argument('--output', default='./DummyPath/', help='Directory to write the BIN and headers to')
+    parser.add_argument('--name', default='level', help='Name used for the texture header and BIN')
+    parser.add_argument('--scene', action='append', default=[], help='Only export objects of this scene (repeatable)')
+    parser.add_argument('--cache', default='./cache/textures', help='Converted texture cache directory')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Conversion worker processes')
+    parser.add_argument('--no-convert', action='store_true', help='Use the saved conversions as they are')
+    parser.add_argument('--no-pack', action='store_true', help='Use the saved VRAM positions as they are')
+    parser.add_argument('--packer', choices=['maxRects', 'firstFit', 'optimize', 'incremental'], default='maxRects', help='VRAM packing strategy')
+    parser.add_argument('--pack-budget', type=float, default=3.0, help='Seconds the optimize packer may spend trying layouts')
+    parser.add_argument('--compare-packers', action='store_true', help='Also pack with first-fit and report the fill gained over it')
+    parser.add_argument('--compress', action='store_true', help='Also write the texture BIN as a zstd compressed, indexed .ZBIN')
+    parser.add_argument('--blobs', action='store_true', help='Write texture and prim data as .bin files with .incbin stubs instead of C arrays')
+    parser.add_argument('--indexed', action='store_true', help='Write model headers with a shared vertex pool and per triangle indices')
+    parser.add_argument('--model-bins', action='store_true', help='Also write every object as a binary model BIN')
+    parser.add_argument('--vram-dump', action='store_true', help='Also write a raw 1024x512 VRAM image as VRAM.BIN')
+    parser.add_argument('--save', help='Write the resulting converted materials to this file')
+    parser.add_argument('--timings', help='Write the per stage timings to this JSON file')
+    args = parser.parse_args(argv)
+
+    timer = StageTimer()
+    pipelineSettings = {}
+    if args.settings:
+        with open(args.settings) as settingsFile:
+            pipelineSettings = json.load(settingsFile)
+    vramSettings = applyFields(VRAMSettings(), pipelineSettings.get('vram', {}))
+    def load():
+        with open(args.blender, 'rb') as blenderFile:
+            blenderData = pickle.load(blenderFile)
+        convertedMats = {}
+        if os.path.exists(args.mats):
+            with open(args.mats, 'rb') as matsFile:
+                convertedMats = pickle.load(matsFile)
+        return blenderData, convertedMats
+    blenderData, convertedMats = timer.run('load', load)
+    if not args.no_convert:
+        timer.run('convert', convertAll, blenderData, convertedMats, pipelineSettings, args.cache, args.workers)
+    if not args.no_pack:
+        failed = timer.run('pack', packAll, convertedMats, vramSettings, args.packer, args.compare_packers, args.pack_budget, args.workers)
+        for matID, itemType in failed:
+            print(f'Did not fit in VRAM: {itemType} {matID}')
+    os.makedirs(args.output, exist_ok=True)
+    timer.run('texture bin', exportTextureBin, convertedMats, args.output, f'{args.name.upper()}')
+    if args.compress:
+        timer.run('texture zbin', exportTextureArchive, convertedMats, args.output, f'{args.name.upper()}')
+    if args.blobs:
+        timer.run('texture blob', exportTextureBlob, convertedMats, args.output, args.name)
+    else:
+        timer.run('texture header', exportTextureHeader, convertedMats, args.output, args.name)
+    if args.vram_dump:
+        timer.run('vram dump', dumpVRAM, convertedMats, f'{args.output}/VRAM.BIN')
+    # Every object is exported in the worker pool, models.json in the output lists what was written
+    modelFormats = ['blob' if args.blobs else 'indexed' if args.indexed else 'header'] + (['bin'] if args.model_bins else [])
+    manifest = timer.run('models', exportScenes, blenderData, convertedMats, args.output, args.scene, modelFormats, args.workers)
+    print(f'{len(manifest["objects"])} objects, {manifest["prims"]} prims, {manifest["skippedPolys"]} polys skipped')
+    if args.save:
+        with open(args.save, 'wb') as saveFile:
+            pickle.dump(convertedMats, saveFile)
+    print(f'{"total":<16}{sum(timer.timings.values())*1000:10.1f} ms')
+    if args.timings:
+        with open(args.timings, 'w') as timingsFile:
+            json.dump(timer.timings, timingsFile, indent=4)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
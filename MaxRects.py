@@ -0,0 +1,114 @@
+# Standard imports
+import time, random
+# Library imports
+import numpy as np
+
+# MaxRects free space tracker for VRAM. The free space is kept as the list of maximal empty rectangles, an
+# item is put in the corner of the free rectangle that scores best for the chosen heuristic and every free
+# rectangle it overlaps is split around it. Free rectangles start split at the 256 line page rows so a
+# texture can never straddle one, texture page columns and alignment are handled when picking x and y.
+#
+# rectpack has the same heuristics but can't pre-occupy space (framebuffers, pinned items) or restrict x
+# per item, so the free list is tracked here with NumPy arrays instead.
+
+HEURISTICS = ('bssf', 'blsf', 'baf', 'bl')
+ORDERINGS = {
+    'longestSide': lambda w, h: (-max(w, h), -w*h),
+    'area': lambda w, h: (-w*h, -max(w, h)),
+    'height': lambda w, h: (-h, -w),
+    'width': lambda w, h: (-w, -h),
+    'perimeter': lambda w, h: (-(w+h), -w*h),
+}
+
+class MaxRects:
+    def __init__(self, width = 1024, height = 512, pageHeight = 256):
+        self.free = np.array([(0, y, width, min(pageHeight, height-y)) for y in range(0, height, pageHeight)], dtype=np.int64)
+    def occupy(self, x, y, w, h):
+        if w <= 0 or h <= 0: return
+        fx, fy, fw, fh = self.free.T
+        hit = (fx < x+w) & (x < fx+fw) & (fy < y+h) & (y < fy+fh)
+        if not hit.any(): return
+        kept = self.free[~hit]
+        pieces = []
+        for fx, fy, fw, fh in self.free[hit].tolist():
+            if x > fx: pieces.append((fx, fy, x-fx, fh))
+            if x+w < fx+fw: pieces.append((x+w, fy, fx+fw-x-w, fh))
+            if y > fy: pieces.append((fx, fy, fw, y-fy))
+            if y+h < fy+fh: pieces.append((fx, y+h, fw, fy+fh-y-h))
+        if len(pieces) == 0:
+            self.free = kept
+            return
+        pieces = np.array(pieces, dtype=np.int64)
+        # The pieces are parts of rects that were maximal, so only they can end up inside another rect
+        others = np.concatenate((kept, pieces))
+        px, py, pw, ph = [column[:, None] for column in pieces.T]
+        ox, oy, ow, oh = [column[None, :] for column in others.T]
+        inside = (px >= ox) & (py >= oy) & (px+pw <= ox+ow) & (py+ph <= oy+oh)
+        # Drop a piece if it is inside another rect, of two identical pieces only the first is kept
+        identical = (px == ox) & (py == oy) & (pw == ow) & (ph == oh)
+        later = np.arange(len(others))[None, :] >= len(kept) + np.arange(len(pieces))[:, None]
+        inside &= ~(identical & later)
+        self.free = np.concatenate((kept, pieces[~inside.any(1)]))
+    def findPosition(self, w, h, tpWidth = None, xAlign = 1, heuristic = 'bssf', yAlign = 1):
+        # Returns (x, y) for a w x h item or None. Textures pass the width of their texture page, which has
+        # to start on a 64 halfword column and contain the whole texture.
+        if len(self.free) == 0: return None
+        if tpWidth != None and w > tpWidth: return None
+        fx, fy, fw, fh = self.free.T
+        x = -(-fx // xAlign) * xAlign
+        y = -(-fy // yAlign) * yAlign
+        if tpWidth != None:
+            # Move to the next texture page column if the texture would run out of its page
+            outside = x + w > x//64*64 + tpWidth
+            x = np.where(outside, (x//64 + 1)*64, x)
+        fits = (x + w <= fx + fw) & (y + h <= fy + fh)
+        if not fits.any(): return None
+        leftX = fx + fw - x - w
+        leftY = fy + fh - y - h
+        if heuristic == 'bssf':
+            score = (np.minimum(leftX, leftY), np.maximum(leftX, leftY))
+        elif heuristic == 'blsf':
+            score = (np.maximum(leftX, leftY), np.minimum(leftX, leftY))
+        elif heuristic == 'baf':
+            score = (fw*fh - w*h, np.minimum(leftX, leftY))
+        elif heuristic == 'bl':
+            score = (y + h, x)
+        else:
+            raise ValueError(f'Unknown MaxRects heuristic "{heuristic}"')
+        # Ties go to the lowest then leftmost position
+        order = np.lexsort((x, y) + score[::-1])
+        best = order[fits[order]][0]
+        return int(x[best]), int(y[best])
+    def largestFree(self):
+        # Area of the biggest empty rectangle (within one page row)
+        if len(self.free) == 0: return 0
+        return int((self.free[:, 2] * self.free[:, 3]).max())
+
+def packRequests(reserved, requests, ordering = 'longestSide', heuristic = 'bssf', seed = None, deadline = None):
+    # Places requests of (key, w, h, tpWidth, xAlign, yAlign) around the reserved rects. Returns {key: (x, y)} for
+    # the requests that fit and the largest free block left. The 'jitter' ordering is longest side first
+    # with every item's size scaled by a random factor, so each seed tries a slightly different order. Past
+    # the deadline (a time.time() value) it gives up and returns None.
+    space = MaxRects()
+    for rect in reserved:
+        space.occupy(*rect)
+    if ordering == 'jitter':
+        rng = random.Random(seed)
+        jitter = {request[0]: rng.uniform(0.75, 1.25) for request in requests}
+        order = sorted(requests, key=lambda request: -max(request[1], request[2])*jitter[request[0]])
+    else:
+        order = sorted(requests, key=lambda request: ORDERINGS[ordering](request[1], request[2]))
+    placements = {}
+    for key, w, h, tpWidth, xAlign, yAlign in order:
+        if deadline != None and time.time() > deadline: return None
+        position = space.findPosition(w, h, tpWidth, xAlign, heuristic, yAlign)
+        if position == None: continue
+        space.occupy(*position, w, h)
+        placements[key] = position
+    return placements, space.largestFree()
+def packTrial(trial):
+    # Process pool entry point, trial is (name, reserved, requests, ordering, heuristic, seed, deadline)
+    name, *args = trial
+    result = packRequests(*args)
+    if result == None: return None
+    return (name, *result)
@@ -0,0 +1,193 @@
+# Library imports
+import numpy as np
+# Custom imports
+from PaletteSharing import clutSource
+from Dedup import textureSource
+from HeaderWriter import HeaderWriter
+
+# Writers for a single Blender object's prims, shared by the model exporter tab and the headless pipeline
+
+# In memory layout of struct TriVertPack and struct PolyGT3Tiled from types_gfx.h
+VERT_DTYPE = np.dtype([('xy', '<i2', 6), ('z', '<i2', 3), ('pad', '<i2')])
+PRIM_DTYPE = np.dtype([
+    ('tag', '<u4'), ('tile', '<u4'),
+    ('rgb0', 'u1', 3), ('code', 'u1'), ('xy0', '<i2', 2), ('uv0', 'u1', 2), ('clut', '<u2'),
+    ('rgb1', 'u1', 3), ('pad1', 'u1'), ('xy1', '<i2', 2), ('uv1', 'u1', 2), ('tpage', '<u2'),
+    ('rgb2', 'u1', 3), ('pad2', 'u1'), ('xy2', '<i2', 2), ('uv2', 'u1', 2), ('pad3', '<u2'),
+])
+# Model BIN header, the verts and the two prim buffers follow at the given offsets
+MODEL_HEADER_DTYPE = np.dtype([('magic', 'S4'), ('version', '<u2'), ('headerSize', '<u2'), ('vertCount', '<u4'), ('primCount', '<u4'),
+    ('vertOffset', '<u4'), ('primOffset', '<u4', 2)])
+# Per material prim values, see materialTable()
+MAT_DTYPE = np.dtype([('exportable', 'u1'), ('tile', '<u4'), ('clut', '<u2'), ('tpage', '<u2'), ('uvScale', '<i4', 2), ('vBase', '<i4'), ('uvOffset', '<i4', 2)])
+# Rows of the vertex and prim arrays, the prim index comes first and is only used for the comment
+VERT_ROW = "\t/* Tri {} */ {{" + "{}, "*9 + "0, }},\n"
+PRIM_ROW = ("    /* Prim {} */ {{(u32*){}, {}, {}, {}, {}, {}, 0, 0, {}, {}, {}, "
+    "{}, {}, {}, 0, 0, 0, {}, {}, {}, {}, {}, {}, 0, 0, 0, {}, {}, 0}}, \n")
+
+def exportModelBin(obj, convertedMats, outputPath, outputName, matTable = None):
+    # Header, verts, then both prim buffers, each laid out like the C structs so the file can be read or
+    # mapped straight into memory. Returns the number of prims written.
+    vertRows, primRows = modelRows(obj, convertedMats, matTable)
+    verts = vertArray(vertRows)
+    prims = primArray(primRows)
+    header = np.zeros(1, dtype=MODEL_HEADER_DTYPE)
+    header['magic'] = b'PSXM'
+    header['version'] = 1
+    header['headerSize'] = MODEL_HEADER_DTYPE.itemsize
+    header['vertCount'] = len(verts)
+    header['primCount'] = len(prims)
+    header['vertOffset'] = MODEL_HEADER_DTYPE.itemsize
+    header['primOffset'] = [header['vertOffset'][0] + verts.nbytes + buffer*prims.nbytes for buffer in range(2)]
+    with open(f'{outputPath}/{outputName}.BIN', 'wb') as outputFile:
+        outputFile.write(header.tobytes() + verts.tobytes() + prims.tobytes()*2)
+    return len(prims)
+def loadModelBin(path):
+    # Maps a model BIN, returns the header and the verts and prim buffers as views of the file
+    data = np.memmap(path, dtype='u1', mode='r')
+    header = data[:MODEL_HEADER_DTYPE.itemsize].view(MODEL_HEADER_DTYPE)[0]
+    if header['magic'] != b'PSXM' or header['version'] != 1: raise ValueError(f'{path} is not a version 1 model BIN')
+    def section(offset, dtype, count):
+        return data[offset:offset+count*dtype.itemsize].view(dtype)
+    verts = section(header['vertOffset'], VERT_DTYPE, header['vertCount'])
+    prims = [section(offset, PRIM_DTYPE, header['primCount']) for offset in header['primOffset']]
+    return header, verts, prims
+def materialTable(convertedMats):
+    # Everything a prim needs from its material, worked out once per export. Returns {matName: row} and a
+    # MAT_DTYPE array, row 0 is a blank entry for materials that aren't converted.
+    matIndex = {}
+    table = np.zeros(len(convertedMats)+1, dtype=MAT_DTYPE)
+    for row, matName in enumerate(convertedMats, 1):
+        matIndex[matName] = row
+        mat = convertedMats[matName]
+        clutMat = clutSource(convertedMats, mat)
+        texMat = textureSource(convertedMats, mat)
+        # Hack to prevent unconverted/packed mats from crashing everything, just skip them
+        if not texMat.packed: continue
+        if mat.colorMode != 15 and not clutMat.packedCLUT: continue
+        tpOffsetX = (texMat.xPos & 0b111111) << {15: 0, 8: 1, 4: 2}[mat.colorMode]
+        tpOffsetY = texMat.yPos & 0xFF
+        # Make tile prim
+        if mat.tiled:
+            tilePrimX = {8: 0b11111, 16: 0b11110, 32: 0b11100, 64: 0b11000, 128: 0b10000, 256: 0b00000}[mat.tileX]
+            tilePrimY = {8: 0b11111, 16: 0b11110, 32: 0b11100, 64: 0b11000, 128: 0b10000, 256: 0b00000}[mat.tileY]
+            tilePrim = (0xE20<<20) + ((tpOffsetY>>3)<<15) + ((tpOffsetX>>3)<<10) + (tilePrimY<<5) + (tilePrimX)
+        else:
+            tilePrim = 0
+        clutID = 0
+        if clutMat.packedCLUT:
+            clutID = (clutMat.yPosCLUT << 6) + (clutMat.xPosCLUT >> 4)
+        tpX = (texMat.xPos & 0b1111000000) >> 6
+        tpY = (texMat.yPos & 0b100000000) >> 8
+        tpC = {15: 0b10, 8: 0b01, 4: 0b00}[mat.colorMode]
+        semiTrans = 0b00
+        tPageID = (tpC << 7) + (semiTrans << 5) + (tpY << 4) + (tpX)
+        # UVs are u*scaleX + offsetX and vBase - v*scaleY + offsetY, tiled UVs are relative to the tile and
+        # flipped from the bottom of the page
+        if mat.tiled: table[row] = (1, tilePrim, clutID, tPageID, (mat.xSize-1, mat.ySize-1), 255, (0, 0))
+        else: table[row] = (1, tilePrim, clutID, tPageID, (mat.xSize-1, mat.ySize-1), mat.ySize-1, (tpOffsetX, tpOffsetY))
+    return matIndex, table
+def polyMaterials(obj, matTable):
+    # Indices of the polys that can be exported and their material table entries
+    matIndex, table = matTable
+    params = table[[matIndex.get(matName, 0) for matName in obj.mats]]
+    index = np.flatnonzero(params['exportable'])
+    return index, params[index]
+def modelRows(obj, convertedMats, matTable = None):
+    # Returns the vertex and prim rows of every poly with a packed material as (n, 10) and (n, 21) arrays,
+    # each row starts with the poly index. Pass the materialTable() when exporting several objects.
+    scale = 32768/100
+    if matTable == None: matTable = materialTable(convertedMats)
+    index, params = polyMaterials(obj, matTable)
+    tilePrim, clutID, tPageID, vBase = [params[field].astype(np.int64)[:, None] for field in ('tile', 'clut', 'tpage', 'vBase')]
+    uvScale = params['uvScale'].astype(np.int64)[:, None, :]
+    uvOffset = params['uvOffset'].astype(np.int64)
+    # Verts, truncated to fixed point like int() does
+    polys = np.asarray(obj.polys, dtype=np.int64).reshape(-1, 3)[index]
+    verts = np.trunc(np.asarray(obj.verts, dtype=np.float64).reshape(-1, 3)[polys]*scale).astype(np.int64)
+    vertRows = np.column_stack((index, verts[:, :, :2].reshape(-1, 6), verts[:, :, 2]))
+    # Get poly params
+    tag = np.full((len(index), 1), 0x0A000000)
+    code = np.full((len(index), 1), 0b110100)
+    if len(obj.colors) != 0:
+        # Vertex colors may come with alpha, only RGB goes in the prim
+        rgb = np.trunc(np.asarray(obj.colors, dtype=np.float64)[index][..., :3]*255).astype(np.int64)
+    else:
+        rgb = np.full((len(index), 3, 3), 127)
+    # Unfuck UVs
+    uv = np.asarray(obj.uvs, dtype=np.float64).reshape(-1, 3, 2)[index]
+    uv[np.isnan(uv)] = 0
+    # First remove negative UVs
+    shift = np.ceil(np.abs(uv.min(1, keepdims=True)))
+    uv += np.where((uv < 0).any(1, keepdims=True), shift, 0)
+    # Next, remove UVs that are offset outside the 0, 1 range
+    shift = np.floor(np.abs(uv.min(1, keepdims=True)))
+    uv -= np.where((uv >= 1).all(1, keepdims=True), shift, 0)
+    u = np.trunc(uv[:, :, 0]*uvScale[:, :, 0]).astype(np.int64) + uvOffset[:, :1] & 0xFF
+    v = np.trunc(vBase-(uv[:, :, 1]*uvScale[:, :, 1])).astype(np.int64) + uvOffset[:, 1:] & 0xFF
+    primRows = np.column_stack((index, tag, tilePrim, rgb[:, 0], code, u[:, 0], v[:, 0], clutID,
+        rgb[:, 1], u[:, 1], v[:, 1], tPageID, rgb[:, 2], u[:, 2], v[:, 2]))
+    return vertRows, primRows
+def vertArray(vertRows):
+    rows = np.array(vertRows, dtype=np.int64).reshape(-1, 10)
+    verts = np.zeros(len(rows), dtype=VERT_DTYPE)
+    verts['xy'] = rows[:, 1:7]
+    verts['z'] = rows[:, 7:10]
+    return verts
+def primArray(primRows):
+    rows = np.array(primRows, dtype=np.int64).reshape(-1, 21)
+    prims = np.zeros(len(rows), dtype=PRIM_DTYPE)
+    for field, start, end in (('tag', 1, 2), ('tile', 2, 3), ('rgb0', 3, 6), ('code', 6, 7), ('uv0', 7, 9), ('clut', 9, 10),
+            ('rgb1', 10, 13), ('uv1', 13, 15), ('tpage', 15, 16), ('rgb2', 16, 19), ('uv2', 19, 21)):
+        # Values wrap to the field size like they do in the C initializers
+        prims[field] = rows[:, start:end].reshape(prims[field].shape).astype(prims[field].dtype)
+    return prims
+def exportModelHeader(obj, convertedMats, outputPath, outputName, matTable = None):
+    # Returns the number of prims written
+    vertRows, primRows = modelRows(obj, convertedMats, matTable)
+    modelFile = HeaderWriter(f'{outputPath}/data_model_{outputName}.h')
+    modelFile.write(f"#ifndef prims_{outputName}_h\n#define prims_{outputName}_h\n")
+    modelFile.write('#include "types_gfx.h"\n\n')
+    modelFile.write(f'struct TriVertPack DAT_VERTNORMS_{outputName}[] = {{\n')
+    modelFile.writeRows(vertRows, VERT_ROW)
+    modelFile.write("};\n\n")
+    writePrims(modelFile, primRows, outputName)
+    modelFile.close()
+    return len(primRows)
+def writePrims(modelFile, primRows, outputName):
+    # The prims are double buffered so the same data goes in both arrays
+    for buffer in range(2):
+        modelFile.write(f"struct PolyGT3Tiled DAT_PRIMS_{outputName}_{buffer}[] = {{\n")
+        modelFile.writeRows(primRows, PRIM_ROW)
+        modelFile.write(f"}};\n")
+    modelFile.write(f'\n#define PRIMS_LEN_{outputName} {len(primRows)}\n')
+    modelFile.write(f'#endif')
+def indexedVerts(vertRows):
+    # Splits vertex rows into a pool of unique fixed point positions, in the order they're first used, and
+    # the (n, 3) pool indices of every triangle
+    rows = np.asarray(vertRows, dtype=np.int64).reshape(-1, 10)
+    positions = np.stack((rows[:, 1:7:2], rows[:, 2:7:2], rows[:, 7:10]), axis=2).reshape(-1, 3)
+    pool, first, inverse = np.unique(positions, axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    remap = np.empty(len(pool), dtype=np.int64)
+    remap[order] = np.arange(len(pool))
+    return pool[order], remap[inverse.ravel()].reshape(-1, 3)
+def exportModelIndexed(obj, convertedMats, outputPath, outputName, matTable = None):
+    # Like exportModelHeader, but each position is stored once as an SVECTOR and the triangles index into
+    # them, so the GTE only has to transform every vertex once. Returns the number of prims written.
+    vertRows, primRows = modelRows(obj, convertedMats, matTable)
+    pool, tris = indexedVerts(vertRows)
+    if len(pool) > 0xFFFF: raise ValueError(f'{outputName} has {len(pool)} unique verts, indices are 16 bit')
+    modelFile = HeaderWriter(f'{outputPath}/data_model_{outputName}.h')
+    modelFile.write(f"#ifndef prims_{outputName}_h\n#define prims_{outputName}_h\n")
+    modelFile.write('#include "types_gfx.h"\n\n')
+    modelFile.write(f'SVECTOR DAT_VERTS_{outputName}[] = {{\n')
+    modelFile.writeRows(pool, "\t{{{}, {}, {}, 0}},\n")
+    modelFile.write("};\n\n")
+    modelFile.write(f'unsigned short DAT_TRIS_{outputName}[][3] = {{\n')
+    modelFile.writeRows(np.column_stack((vertRows[:, 0], tris)), "\t/* Tri {} */ {{{}, {}, {}}},\n")
+    modelFile.write("};\n\n")
+    modelFile.write(f'#define VERTS_LEN_{outputName} {len(pool)}\n')
+    writePrims(modelFile, primRows, outputName)
+    modelFile.close()
+    return len(primRows)
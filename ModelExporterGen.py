@@ -37,9 +37,18 @@ class Ui_ModelExporter(object):
         self.exportHeaderButton = QtWidgets.QPushButton(ModelExporter)
         self.exportHeaderButton.setObjectName("exportHeaderButton")
         self.verticalLayout.addWidget(self.exportHeaderButton)
+        self.exportIndexedButton = QtWidgets.QPushButton(ModelExporter)
+        self.exportIndexedButton.setObjectName("exportIndexedButton")
+        self.verticalLayout.addWidget(self.exportIndexedButton)
         self.exportBinButton = QtWidgets.QPushButton(ModelExporter)
         self.exportBinButton.setObjectName("exportBinButton")
         self.verticalLayout.addWidget(self.exportBinButton)
+        self.exportBlobButton = QtWidgets.QPushButton(ModelExporter)
+        self.exportBlobButton.setObjectName("exportBlobButton")
+        self.verticalLayout.addWidget(self.exportBlobButton)
+        self.exportSceneButton = QtWidgets.QPushButton(ModelExporter)
+        self.exportSceneButton.setObjectName("exportSceneButton")
+        self.verticalLayout.addWidget(self.exportSceneButton)
         self.ModelExporterLayout.addLayout(self.verticalLayout, 0, 0, 1, 1)
         self.gridLayout_2.addLayout(self.ModelExporterLayout, 0, 0, 1, 1)
         self.modelViewGL = QtWidgets.QOpenGLWidget(ModelExporter)
@@ -56,4 +65,7 @@ class Ui_ModelExporter(object):
         self.sceneListLabel.setText(_translate("ModelExporter", "Scene"))
         self.objectListLabel.setText(_translate("ModelExporter", "Object"))
         self.exportHeaderButton.setText(_translate("ModelExporter", "Export as Header"))
+        self.exportIndexedButton.setText(_translate("ModelExporter", "Export as Indexed Header"))
         self.exportBinButton.setText(_translate("ModelExporter", "Export as Bin"))
+        self.exportBlobButton.setText(_translate("ModelExporter", "Export as Blob"))
+        self.exportSceneButton.setText(_translate("ModelExporter", "Export Every Object in Scene"))
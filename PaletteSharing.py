@@ -0,0 +1,124 @@
+# Standard imports
+import os
+# Library imports
+import numpy as np
+from PIL import Image
+# Custom imports
+from Conversion import preparePixels, ditherType
+import Quantizer
+
+# Groups indexed materials with similar colors so they can share one CLUT in VRAM. Each group's palette is
+# built from the combined histogram of its members and every member is requantized against it. The first
+# member of a group owns the CLUT, the rest point at it with clutOwner and never pack a CLUT of their own.
+
+def clutSource(convertedMats, mat):
+    # Returns the material holding the CLUT a material should use
+    if mat.clutOwner == None: return mat
+    owner = convertedMats.get(mat.clutOwner)
+    if owner == None or owner.clutGroup != mat.clutGroup: return mat
+    return owner
+def colorFeature(counts):
+    # Collapse the 32x32x32 histogram to 8x8x8 and normalize it so images of any size can be compared
+    coarse = counts.reshape(8, 4, 8, 4, 8, 4).sum(axis=(1, 3, 5)).reshape(-1).astype(np.float64)
+    return coarse / coarse.sum()
+def clusterFeatures(features, maxDistance):
+    # Average linkage agglomerative clustering on the L1 distance between color features
+    groups = [[i] for i in range(len(features))]
+    centroids = features.copy()
+    distances = np.abs(centroids[:, None, :] - centroids[None, :, :]).sum(axis=2)
+    np.fill_diagonal(distances, np.inf)
+    alive = np.ones(len(features), dtype=bool)
+    while alive.sum() > 1:
+        flatIndex = np.argmin(distances)
+        i, j = np.unravel_index(flatIndex, distances.shape)
+        if distances[i, j] > maxDistance: break
+        # Merge j into i and only recompute the distances of the merged group
+        weightI = len(groups[i])
+        weightJ = len(groups[j])
+        centroids[i] = (centroids[i]*weightI + centroids[j]*weightJ) / (weightI + weightJ)
+        groups[i] += groups[j]
+        groups[j] = []
+        alive[j] = False
+        distances[j, :] = np.inf
+        distances[:, j] = np.inf
+        rowDistances = np.abs(centroids - centroids[i]).sum(axis=1)
+        rowDistances[~alive] = np.inf
+        rowDistances[i] = np.inf
+        distances[i, :] = rowDistances
+        distances[:, i] = rowDistances
+    return [group for group in groups if len(group) != 0]
+def shareCLUTs(convertedMats, maxDistance = 0.5):
+    # Returns the number of CLUTs before and after sharing
+    candidates = {4: [], 8: []}
+    for mat in convertedMats.values():
+        if mat.type != 'T' or mat.colorMode not in candidates: continue
+        if not mat.valid or mat.textureCLUT == None or mat.settings == None: continue
+        if not os.path.exists(mat.origTexturePath): continue
+        candidates[mat.colorMode].append(mat)
+    clutsBefore = len(set(clutSource(convertedMats, mat).id for mats in candidates.values() for mat in mats))
+    clutsAfter = 0
+    for colorMode, mats in candidates.items():
+        if len(mats) == 0: continue
+        colorCount = {4: 16, 8: 256}[colorMode]
+        # Requantize from the originals rather than the already quantized textures
+        pixels = [preparePixels(Image.open(mat.origTexturePath), mat.settings)[0] for mat in mats]
+        counts = [Quantizer.histogram(matPixels) for matPixels in pixels]
+        groups = clusterFeatures(np.array([colorFeature(matCounts) for matCounts in counts]), maxDistance)
+        for group in groups:
+            clutsAfter += 1
+            owner = mats[group[0]]
+            if len(group) == 1:
+                # Not similar enough to anything, give it back its own palette if it used to share one
+                if owner.clutGroup == None: continue
+                owner.textureImg, owner.textureCLUT = Quantizer.quantize(pixels[group[0]], colorCount, ditherType(owner.settings), owner.xSize)
+                owner.clutGroup = None
+                owner.clutOwner = None
+                owner.generation += 1
+                continue
+            sharePalette([mats[i] for i in group], [pixels[i] for i in group], [counts[i] for i in group], colorCount)
+    return clutsBefore, clutsAfter
+def sharePalette(mats, pixels, counts, colorCount):
+    # Requantizes mats against the palette of their combined histogram, the first one owns the CLUT
+    owner = mats[0]
+    palette = Quantizer.paletteFromHistogram(sum(counts), colorCount)
+    sharedCLUT = Quantizer.paletteImg(palette, colorCount)
+    for mat, matPixels in zip(mats, pixels):
+        mat.textureImg = Quantizer.applyPalette(matPixels, palette, ditherType(mat.settings), mat.xSize)
+        mat.textureCLUT = sharedCLUT
+        mat.clutGroup = owner.id
+        mat.clutOwner = None if mat is owner else owner.id
+        mat.generation += 1
+        if mat is not owner: mat.packedCLUT = False
+def clutGroups(convertedMats):
+    # {groupID: [matID, ...]} of the shared CLUT groups, with the owner first
+    groups = {}
+    for matID, mat in convertedMats.items():
+        if mat.clutGroup == None: continue
+        groups.setdefault(mat.clutGroup, []).append(matID)
+    for groupID, matIDs in groups.items():
+        matIDs.sort(key=lambda matID: matID != groupID)
+    return groups
+def restoreCLUTGroups(convertedMats, groups):
+    # Shares the CLUTs of clutGroups() again after the members were reconverted with palettes of their own,
+    # returns the number of groups restored
+    restored = 0
+    for matIDs in groups.values():
+        mats = [convertedMats[matID] for matID in matIDs if matID in convertedMats]
+        mats = [mat for mat in mats if mat.type == 'T' and mat.colorMode in (4, 8) and mat.textureCLUT != None
+            and mat.settings != None and os.path.exists(mat.origTexturePath)]
+        mats = [mat for mat in mats if mat.colorMode == mats[0].colorMode]
+        if len(mats) < 2: continue
+        pixels = [preparePixels(Image.open(mat.origTexturePath), mat.settings)[0] for mat in mats]
+        sharePalette(mats, pixels, [Quantizer.histogram(matPixels) for matPixels in pixels], {4: 16, 8: 256}[mats[0].colorMode])
+        restored += 1
+    return restored
+def repairCLUTGroups(convertedMats):
+    # Promote a new owner for groups whose owner was unconverted or reconverted
+    for mat in convertedMats.values():
+        if mat.clutOwner == None or clutSource(convertedMats, mat) is not mat: continue
+        oldGroup = mat.clutGroup
+        oldOwner = mat.clutOwner
+        for member in convertedMats.values():
+            if member.clutGroup == oldGroup and member.clutOwner == oldOwner:
+                member.clutGroup = mat.id
+                member.clutOwner = None if member is mat else mat.id
@@ -0,0 +1,40 @@
+# Standard imports
+from collections import OrderedDict
+
+# Bounded in-memory cache of decoded and scaled preview pixmaps. Keys are tuples whose second element is
+# the material ID so every entry of a material can be dropped when it is reconverted. Least recently used
+# entries are evicted once the pixmaps take up more than maxBytes.
+
+class PixmapCache:
+    def __init__(self, maxBytes = 128*1024*1024):
+        self.maxBytes = maxBytes
+        self.totalBytes = 0
+        self.entries = OrderedDict()
+    def pixmapBytes(self, pixmap):
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+    def get(self, key):
+        if key not in self.entries: return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+    def put(self, key, pixmap):
+        if key in self.entries:
+            self.totalBytes -= self.pixmapBytes(self.entries.pop(key))
+        self.entries[key] = pixmap
+        self.totalBytes += self.pixmapBytes(pixmap)
+        # Always keep the newest entry, even if it is bigger than the whole budget
+        while self.totalBytes > self.maxBytes and len(self.entries) > 1:
+            oldKey, oldPixmap = self.entries.popitem(last=False)
+            self.totalBytes -= self.pixmapBytes(oldPixmap)
+    def fetch(self, key, build):
+        # Returns the cached pixmap for key, building and caching it first if needed
+        pixmap = self.get(key)
+        if pixmap == None:
+            pixmap = build()
+            self.put(key, pixmap)
+        return pixmap
+    def invalidate(self, matID):
+        for key in [key for key in self.entries if key[1] == matID]:
+            self.totalBytes -= self.pixmapBytes(self.entries.pop(key))
+    def clear(self):
+        self.entries.clear()
+        self.totalBytes = 0
@@ -0,0 +1,104 @@
+# Library imports
+import numpy as np
+from PIL import Image
+# Custom imports
+from TextureOps import padWidth
+
+# Palette quantizer for 4bpp/8bpp textures that works in 15-bit color from the start, so palette entries
+# can not collide when they are snapped to the PSX's 5 bits per channel after quantization
+
+# 4x4 ordered dither offsets, same matrix the GPU uses when dithering is enabled
+BAYER_4X4 = np.array([
+    [-4,  0, -3,  1],
+    [ 2, -2,  3, -1],
+    [-3,  1, -4,  0],
+    [ 3, -1,  2, -2],
+], dtype=np.int16)
+
+def pack15(pixels):
+    # HxWx3 uint8 array to flat 15-bit color indices (rrrrrgggggbbbbb)
+    pixels = pixels.reshape(-1, 3) >> 3
+    return (pixels[:, 0].astype(np.int32) << 10) | (pixels[:, 1].astype(np.int32) << 5) | pixels[:, 2]
+def unpack15(colors):
+    # Flat 15-bit color indices to Nx3 arrays of 5-bit channels
+    return np.stack(((colors >> 10) & 0x1F, (colors >> 5) & 0x1F, colors & 0x1F), axis=1)
+def medianCut(colors, weights, colorCount):
+    # Median cut over the occupied cells of the 32x32x32 histogram, returns an Nx3 array of 5-bit colors
+    boxes = [np.arange(len(colors))]
+    boxWeights = [weights.sum()]
+    while len(boxes) < colorCount:
+        # Split the box with the most pixels that still has more than one color in it
+        splittable = [i for i in range(len(boxes)) if len(boxes[i]) > 1]
+        if len(splittable) == 0: break
+        bestIndex = max(splittable, key=lambda i: boxWeights[i])
+        box = boxes.pop(bestIndex)
+        boxWeights.pop(bestIndex)
+        boxColors = colors[box]
+        axis = np.argmax(boxColors.max(axis=0) - boxColors.min(axis=0))
+        box = box[np.argsort(boxColors[:, axis], kind='stable')]
+        # Split at the weighted median, but always leave at least one color on each side
+        cumulative = np.cumsum(weights[box])
+        split = int(np.searchsorted(cumulative, cumulative[-1]/2))
+        split = min(max(split, 1), len(box)-1)
+        boxes += [box[:split], box[split:]]
+        boxWeights += [cumulative[split-1], cumulative[-1] - cumulative[split-1]]
+    palette = np.zeros((len(boxes), 3), dtype=np.int32)
+    for i, box in enumerate(boxes):
+        palette[i] = np.rint((colors[box] * weights[box, None]).sum(axis=0) / boxWeights[i])
+    return palette
+def histogram(pixels):
+    # Pixel counts for each cell of the 32x32x32 15-bit color histogram
+    return np.bincount(pack15(pixels), minlength=32768)
+def paletteFromHistogram(counts, colorCount):
+    # Returns an Nx3 uint8 palette (N <= colorCount) with every entry already snapped to 15-bit color
+    occupied = np.nonzero(counts)[0]
+    colors = unpack15(occupied)
+    if len(occupied) <= colorCount:
+        palette = colors
+    else:
+        palette = medianCut(colors, counts[occupied], colorCount)
+    return (palette << 3).astype(np.uint8)
+def buildPalette(pixels, colorCount):
+    return paletteFromHistogram(histogram(pixels), colorCount)
+def nearestIndices(colors, palette):
+    # Index of the closest palette entry for each 15-bit color index
+    # |c-p|^2 = |c|^2 - 2c.p + |p|^2 and |c|^2 is the same for every entry, so only the rest is needed
+    colorChannels = unpack15(colors).astype(np.float32)
+    paletteChannels = (palette >> 3).astype(np.float32)
+    distances = (paletteChannels**2).sum(axis=1)[None, :] - 2*(colorChannels @ paletteChannels.T)
+    return np.argmin(distances, axis=1).astype(np.uint8)
+def remap(pixels, palette):
+    # Maps every pixel to its nearest palette entry without dithering
+    colors = pack15(pixels)
+    uniqueColors, inverse = np.unique(colors, return_inverse=True)
+    return nearestIndices(uniqueColors, palette)[inverse].reshape(pixels.shape[:2])
+def orderedDither(pixels):
+    # Applies the 4x4 ordered dither offsets before the 15-bit truncation
+    height, width = pixels.shape[:2]
+    offsets = np.tile(BAYER_4X4, (height//4 + 1, width//4 + 1))[:height, :width]
+    return np.clip(pixels.astype(np.int16) + offsets[:, :, None], 0, 255).astype(np.uint8)
+def paletteImg(palette, colorCount):
+    # The palette as a colorCount x 1 RGB image, padded with black
+    palletPixels = np.zeros((1, colorCount, 3), dtype=np.uint8)
+    palletPixels[0, :len(palette)] = palette
+    return Image.fromarray(palletPixels)
+def applyPalette(pixels, palette, dither = None, width = None):
+    # Maps an HxWx3 uint8 array onto an existing palette, returns a P mode image
+    # dither is None, 'ordered' or 'FS' (Floyd-Steinberg), the pixels are padded with black up to width first
+    if width != None: pixels = padWidth(pixels, width)
+    height, width = pixels.shape[:2]
+    if dither == 'FS':
+        # Error diffusion is serial per pixel, so hand the remap against our palette to Pillow's C loop
+        palImg = Image.new('P', (1, 1))
+        palImg.putpalette(palette.tobytes())
+        return Image.fromarray(pixels).quantize(len(palette), palette=palImg, dither=Image.FLOYDSTEINBERG)
+    if dither == 'ordered': pixels = orderedDither(pixels)
+    indices = remap(pixels, palette)
+    textureImg = Image.frombytes('P', (width, height), indices.tobytes())
+    textureImg.putpalette(palette.tobytes())
+    return textureImg
+def quantize(pixels, colorCount, dither = None, width = None):
+    # Quantizes an HxWx3 uint8 array, returns the P mode texture and its colorCount x 1 RGB CLUT
+    # The palette is built from the pixels before they are padded up to width
+    palette = buildPalette(pixels, colorCount)
+    return applyPalette(pixels, palette, dither, width), paletteImg(palette, colorCount)
@@ -0,0 +1,75 @@
+# Standard imports
+import os, pickle, hashlib
+
+# Content addressed on-disk cache of converted textures, keyed by the source image bytes and the
+# conversion settings that affect the pixels. Least recently used entries are evicted once the cache
+# grows past maxBytes.
+
+CACHE_VERSION = 3       # Bump whenever the conversion output changes so stale entries are never reused
+
+class TextureCache:
+    def __init__(self, cacheDir = './cache/textures', maxBytes = 512*1024*1024):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        os.makedirs(self.cacheDir, exist_ok=True)
+    def key(self, sourceBytes, settings):
+        hasher = hashlib.sha256()
+        hasher.update(sourceBytes)
+        params = (
+            CACHE_VERSION,
+            settings.resize,
+            settings.xSize if settings.resize else None,
+            settings.ySize if settings.resize else None,
+            settings.scaleType,
+            settings.removeBlack,
+            settings.colorMode,
+            settings.generateCLUT,
+            settings.dither,
+            settings.ditherType if settings.dither else None,
+        )
+        hasher.update(repr(params).encode())
+        return hasher.hexdigest()
+    def entryPath(self, key):
+        return os.path.join(self.cacheDir, f'{key}.pkl')
+    def get(self, key):
+        path = self.entryPath(key)
+        try:
+            with open(path, 'rb') as entryFile:
+                entry = pickle.load(entryFile)
+            # Touch the entry so it counts as recently used
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return entry
+    def put(self, key, entry):
+        path = self.entryPath(key)
+        # Write to a temp file first so other processes never see a half written entry
+        tempPath = f'{path}.{os.getpid()}.tmp'
+        with open(tempPath, 'wb') as entryFile:
+            pickle.dump(entry, entryFile)
+        os.replace(tempPath, path)
+        self.evict()
+    def evict(self):
+        entries = []
+        totalBytes = 0
+        for entry in os.scandir(self.cacheDir):
+            if not entry.name.endswith('.pkl'): continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            totalBytes += stat.st_size
+        if totalBytes <= self.maxBytes: return
+        entries.sort()
+        for mtime, size, path in entries:
+            if totalBytes <= self.maxBytes: break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            totalBytes -= size
+    def clear(self):
+        for entry in os.scandir(self.cacheDir):
+            if entry.name.endswith('.pkl'):
+                os.remove(entry.path)
@@ -1,13 +1,17 @@
 # Standard imports
-import os, math
+import os
 # Library imports
-from PIL import Image
 from PyQt5.QtWidgets import *
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap, QImage
+from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtGui import QPixmap, QImage, QIcon
 # Custom imports
 from BlenderState import BlenderStateManager
 from ConvertedMat import ConvertedMat
+from Conversion import ConvertSettings, convertMat, carryPacking
+from BatchConverter import BatchConverter
+from PaletteSharing import shareCLUTs, repairCLUTGroups
+from PreviewCache import PixmapCache
+from Thumbnails import ThumbnailWorker
 # Generated imports
 from TextureConverterGen import Ui_TextureConverter
 
@@ -19,6 +23,9 @@ class TextureConverterTab(QWidget, Ui_TextureConverter):
         # Tab state
         self.selectedMatID = None
         self.dummyImg = QPixmap('./icons/placeholder.jpg')
+        self.cacheDir = './cache/textures'
+        self.previewCache = PixmapCache()
+        self.lastGenerations = {}
         # Setup tab
         super().__init__()
         self.setupUi(self)
@@ -32,6 +39,32 @@ class TextureConverterTab(QWidget, Ui_TextureConverter):
         self.convertedZoomSelector.currentIndexChanged.connect(self.redrawPreviews)
         self.convertButton.clicked.connect(self.convertSelected)
         self.unconvertButton.clicked.connect(self.unconvertSelected)
+        self.shareCLUTsButton.clicked.connect(self.shareCLUTs)
+        # Setup batch conversion
+        self.batchConverter = BatchConverter(self)
+        self.batchConverter.matConverted.connect(self.batchMatConverted)
+        self.batchConverter.progress.connect(self.batchProgress)
+        self.batchConverter.finished.connect(self.batchFinished)
+        self.cancelButton.clicked.connect(self.batchConverter.cancel)
+        self.cancelButton.setEnabled(False)
+        # Setup list thumbnails
+        self.thumbIcons = {}
+        self.thumbPending = {}
+        self.matList.setIconSize(QSize(32, 32))
+        self.thumbnails = ThumbnailWorker('./cache/thumbs', 32, self)
+        self.thumbnails.thumbnailReady.connect(self.setThumbnail)
+        self.thumbnails.start()
+    def scaledPixmap(self, key, zoom, build):
+        # Cache both the full size pixmap (zoom None) and each zoom level of it
+        pixmap = self.previewCache.fetch(key + (None,), build)
+        if zoom == 1: return pixmap
+        newX = int(pixmap.width() * zoom)
+        newY = int(pixmap.height() * zoom)
+        return self.previewCache.fetch(key + (zoom,), lambda: pixmap.scaled(newX, newY, Qt.KeepAspectRatio))
+    def convertedPixmap(self, convertedImg):
+        convertedImgData = convertedImg.convert("RGBA").tobytes("raw", "RGBA")
+        convertedQImg = QImage(convertedImgData, convertedImg.width, convertedImg.height, QImage.Format_RGBA8888)
+        return QPixmap.fromImage(convertedQImg)
     def redrawPreviews(self):
         originalViewZoom = int(self.originalZoomSelector.currentText().strip('%'))/100
         convertedViewZoom = int(self.convertedZoomSelector.currentText().strip('%'))/100
@@ -41,28 +74,20 @@ class TextureConverterTab(QWidget, Ui_TextureConverter):
         else:
             texturePath = self.blender.data.mats[self.selectedMatID].texturePath
             if not os.path.exists(texturePath): texturePath = ""
+        dummyKey = ('dummy', None)
+        originalKey = dummyKey
+        convertedKey = dummyKey
         # If it has a path draw the original texture
         if texturePath != "":
-            originalTextureQPix = QPixmap(texturePath)
-            # Draw the converted textures if they exist
+            originalKey = ('original', self.selectedMatID, texturePath, os.path.getmtime(texturePath))
+            # Draw the converted textures if they exist, if not draw a placeholder
             if self.selectedMatID in self.convertedMats and self.convertedMats[self.selectedMatID].type == 'T':
-                convertedImg = self.convertedMats[self.selectedMatID].textureImg
-                convertedImgData = convertedImg.convert("RGBA").tobytes("raw", "RGBA")
-                convertedQImg = QImage(convertedImgData, convertedImg.width, convertedImg.height, QImage.Format_RGBA8888)
-                convertedTextureQPix = QPixmap.fromImage(convertedQImg)
-            # If converted textures dont exist, draw a placeholder
-            else:
-                convertedTextureQPix = self.dummyImg
-        # If it doesnt have a path draw placeholders
-        else:
-            originalTextureQPix = self.dummyImg
-            convertedTextureQPix = self.dummyImg
-        newX = int(originalTextureQPix.width() * originalViewZoom)
-        newY = int(originalTextureQPix.height() * originalViewZoom)
-        self.originalTexture.setPixmap(originalTextureQPix.scaled(newX, newY, Qt.KeepAspectRatio))
-        newX = int(convertedTextureQPix.width() * convertedViewZoom)
-        newY = int(convertedTextureQPix.height() * convertedViewZoom)
-        self.convertedTexture.setPixmap(convertedTextureQPix.scaled(newX, newY, Qt.KeepAspectRatio))
+                converted = self.convertedMats[self.selectedMatID]
+                convertedKey = ('converted', self.selectedMatID, converted.generation)
+        buildOriginal = (lambda: self.dummyImg) if originalKey == dummyKey else (lambda: QPixmap(texturePath))
+        buildConverted = (lambda: self.dummyImg) if convertedKey == dummyKey else (lambda: self.convertedPixmap(converted.textureImg))
+        self.originalTexture.setPixmap(self.scaledPixmap(originalKey, originalViewZoom, buildOriginal))
+        self.convertedTexture.setPixmap(self.scaledPixmap(convertedKey, convertedViewZoom, buildConverted))
     def selectMat(self):
         if len(self.matList.selectedItems()) != 0:
             self.selectedMatID = self.matList.selectedItems()[-1].text(2)
@@ -73,135 +98,186 @@ class TextureConverterTab(QWidget, Ui_TextureConverter):
         self.originalZoomSelector.setCurrentText("100%")
         self.convertedZoomSelector.setCurrentText("100%")
         self.redrawPreviews()
-    def convertImg15BPP(self, image):
-        # Reduce the image to 5 bits per channel (15-bit color)
-        for x in range(image.width):
-            for y in range(image.height):
-                oldVal = image.getpixel((x,y))
-                newVal = ((oldVal[0]>>3)<<3, (oldVal[1]>>3)<<3, (oldVal[2]>>3)<<3)
-                image.putpixel((x, y), newVal)
-        return image
-    def convertPallet15BPP(self, image, colorCount):
-        pallet = image.getpalette()
-        palletImgPixels = []
-        for i in range(0, len(pallet), 3):
-            r = (pallet[i] >> 3) << 3
-            g = (pallet[i+1] >> 3) << 3
-            b = (pallet[i+2] >> 3) << 3
-            pallet[i] = r
-            pallet[i+1] = g
-            pallet[i+2] = b
-            palletImgPixels.append((r, g, b))
-        image.putpalette(pallet)
-        palletImg = Image.new('RGB', (colorCount, 1))
-        palletImg.putdata(palletImgPixels)
-        return palletImg
-    def convertSingle(self, selectedID):
+    def snapshotSettings(self):
+        # Copy the conversion options out of the widgets so they can be handed to worker processes
+        settings = ConvertSettings()
+        settings.baseType = self.typeRadioGroup.checkedButton().text()[0]
+        settings.resize = self.adjustSizeCheck.isChecked()
+        settings.xSize = self.adjustWidthSpin.value()
+        settings.ySize = self.adjustHeightSpin.value()
+        settings.scaleType = self.scaleRadioGroup.checkedButton().text()[0]
+        settings.removeBlack = self.removeBlackCheck.isChecked()
+        settings.colorMode = {'1': 15, '4': 4, '8': 8}[self.colorRadioGroup.checkedButton().text()[0]]
+        settings.generateCLUT = self.generateCLUTCheck.isChecked()
+        settings.dither = self.ditheringCheck.isChecked()
+        settings.tiled = self.enableTilingCheck.isChecked()
+        settings.tileX = int(self.tileXSelector.currentText())
+        settings.tileY = int(self.tileYSelector.currentText())
+        settings.forceSemiTrans = self.makeSemiTransCheck.isChecked()
+        return settings
+    def storeConverted(self, matID, converted):
+        oldMat = self.convertedMats.get(matID)
+        carryPacking(oldMat, converted)
+        # Generations keep counting up across unconverts so old previews and thumbnails never match
+        if oldMat != None:
+            converted.generation = oldMat.generation + 1
+        else:
+            converted.generation = self.lastGenerations.get(matID, -1) + 1
+        self.convertedMats[matID] = converted
+        self.previewCache.invalidate(matID)
+        repairCLUTGroups(self.convertedMats)
+    def convertSingle(self, selectedID, settings = None):
         if not selectedID: return
-        baseType = self.typeRadioGroup.checkedButton().text()[0]
-        if baseType == "F" or baseType == "G":
-            converted = ConvertedMat()
-            converted.id = selectedID
-            converted.valid = True
-            converted.type = baseType
-            self.convertedMats[selectedID] = converted
-            return
+        if settings == None: settings = self.snapshotSettings()
         texturePath = self.blender.data.mats[selectedID].texturePath
-        # TODO If no texture but a texture type is specified, show an error message
-        if texturePath == '': return
-        # TODO Check if path is valid, if not show an error message
-        # if not os.path.exists(self.blender.data.mats[self.selectedMatID].texturePath):
-        textureImg = Image.open(texturePath).convert("RGB")
-        ###################
-        # Size Adjustment #
-        ###################
-        if self.adjustSizeCheck.isChecked():
-            xSize = self.adjustWidthSpin.value()
-            ySize = self.adjustHeightSpin.value()
-            scaleType = {'N': Image.NEAREST, 'B': Image.BILINEAR}[self.scaleRadioGroup.checkedButton().text()[0]]
-            textureImg = textureImg.resize((xSize, ySize), scaleType)
-        else:
-            xSize, ySize = textureImg.size
-            # TODO Warning message the image is to big and had to be resized
-            if xSize > 256: xSize = 256
-            if ySize > 256: ySize = 256
-            scaleType = {'N': Image.NEAREST, 'B': Image.BILINEAR}[self.scaleRadioGroup.checkedButton().text()[0]]
-            textureImg = textureImg.resize((xSize, ySize), scaleType)
-        ####################
-        # Color Adjustment #
-        ####################
-        if self.removeBlackCheck.isChecked():
-            textureImgPixels = list(textureImg.getdata())
-            textureImgPixels = [((0b1000, 0b1000, 0b1000) if pixel == (0, 0, 0) else pixel) for pixel in textureImgPixels]
-            textureImg.putdata(textureImgPixels)
-        colorMode = {'1': 15, '4': 4, '8': 8}[self.colorRadioGroup.checkedButton().text()[0]]
-        textureCLUT = None
-        if colorMode == 15:
-            textureImg = self.convertImg15BPP(textureImg)
-            tpXSize = xSize
-        else:
-            colorCount = {4: 16, 8: 256}[colorMode]
-            tpWidthScale = {4: 4, 8: 2}[colorMode]
-            texturePal = textureImg.quantize(colorCount)
-            texturePalImg = self.convertPallet15BPP(texturePal, colorCount)
-            if self.generateCLUTCheck.isChecked():
-                textureCLUT = texturePalImg
-            tpXSize = math.ceil(xSize/tpWidthScale)
-            if xSize%tpWidthScale:
-                xSize = tpXSize*tpWidthScale
-                blackImg = Image.new('RGB', (xSize, ySize), (0, 0, 0))
-                blackImg.paste(textureImg, (0, 0))
-                textureImg = blackImg
-            ditherMode = {True: Image.FLOYDSTEINBERG, False: Image.NONE}[self.ditheringCheck.isChecked()]
-            textureImg = textureImg.quantize(colorCount, palette=texturePal, dither=ditherMode)
-        ##################################
-        # Creating Converted Texture Mat #
-        ##################################
-        converted = ConvertedMat()
-        # General Attributes
-        converted.id = selectedID
-        converted.valid = True
-        converted.type = baseType
-        # Texture Attributes
-        converted.origTexturePath = texturePath
-        converted.textureImg = textureImg
-        converted.xSize = xSize
-        converted.ySize = ySize
-        converted.tiled = self.enableTilingCheck.isChecked()
-        converted.tileX = int(self.tileXSelector.currentText())
-        converted.tileY = int(self.tileYSelector.currentText())
-        converted.forceSemiTrans = self.makeSemiTransCheck.isChecked()
-        converted.colorMode = colorMode
-        converted.tpXSize = tpXSize
-        # CLUT Attributes
-        converted.textureCLUT = textureCLUT
-        # Save converted mat
-        self.convertedMats[selectedID] = converted
+        try:
+            converted = convertMat(selectedID, texturePath, settings, self.cacheDir)
+        except OSError as error:
+            print(f'Failed to convert {selectedID}: {error}')
+            self.window().statusBar().showMessage(f'Failed to convert {selectedID}, could not read {texturePath}')
+            return
+        if converted == None: return
+        self.storeConverted(selectedID, converted)
+    def runJobs(self, jobs):
+        if self.batchConverter.isRunning(): return
+        # Not worth spinning up worker processes for a single material
+        if len(jobs) <= 1:
+            for matID, texturePath, settings, cacheDir in jobs:
+                self.convertSingle(matID, settings)
+            self.redrawPreviews()
+            self.redrawList()
+            return
+        self.convertButton.setEnabled(False)
+        self.unconvertButton.setEnabled(False)
+        self.cancelButton.setEnabled(True)
+        self.batchConverter.start(jobs)
     def convertSelected(self):
-        # TODO Make this convert selected
-        for mat in self.matList.selectedItems():
-            self.convertSingle(mat.text(2))
+        settings = self.snapshotSettings()
+        selectedIDs = [mat.text(2) for mat in self.matList.selectedItems()]
+        self.runJobs([(matID, self.blender.data.mats[matID].texturePath, settings, self.cacheDir) for matID in selectedIDs])
+    def reconvertStale(self):
+        # Reconvert only the invalid materials, each with the settings it was last converted with
+        jobs = []
+        missingIDs = []
+        for matID, converted in self.convertedMats.items():
+            if converted.valid or matID not in self.blender.data.mats: continue
+            settings = converted.settings
+            if settings == None: settings = self.snapshotSettings()
+            texturePath = self.blender.data.mats[matID].texturePath
+            # Materials whose texture is gone stay stale until the file is back
+            if settings.baseType == 'T' and not os.path.exists(texturePath):
+                missingIDs.append(matID)
+                continue
+            jobs.append((matID, texturePath, settings, self.cacheDir))
+        for matID in missingIDs:
+            print(f'Not reconverting {matID}, texture is missing: {self.blender.data.mats[matID].texturePath}')
+        self.runJobs(jobs)
+        if missingIDs: self.window().statusBar().showMessage(f'{len(missingIDs)} stale materials have missing textures, see console')
+        return len(jobs) + len(missingIDs)
+    def batchMatConverted(self, matID, converted):
+        if converted == None: return
+        self.storeConverted(matID, converted)
+        self.redrawListItem(matID)
+        if matID == self.selectedMatID: self.redrawPreviews()
+    def batchProgress(self, doneCount, totalCount, matID):
+        self.window().statusBar().showMessage(f'Converted {doneCount}/{totalCount}: {matID}')
+    def batchFinished(self, cancelled):
+        self.convertButton.setEnabled(True)
+        self.unconvertButton.setEnabled(True)
+        self.cancelButton.setEnabled(False)
+        errorCount = len(self.batchConverter.errors)
+        for matID, error in self.batchConverter.errors.items():
+            print(f'Failed to convert {matID}: {error}')
+        if cancelled:
+            message = f'Conversion cancelled after {self.batchConverter.doneCount}/{self.batchConverter.totalCount}'
+        else:
+            message = f'Converted {self.batchConverter.totalCount - errorCount}/{self.batchConverter.totalCount}'
+        if errorCount: message += f' ({errorCount} failed, see console)'
+        self.window().statusBar().showMessage(message)
         self.redrawPreviews()
-        self.redrawList()
     def unconvertSelected(self):
         for mat in self.matList.selectedItems():
             if mat.text(2) not in self.convertedMats: continue
+            self.lastGenerations[mat.text(2)] = self.convertedMats[mat.text(2)].generation
             del self.convertedMats[mat.text(2)]
+            self.previewCache.invalidate(mat.text(2))
+            self.thumbIcons.pop((mat.text(2), 'converted'), None)
+        repairCLUTGroups(self.convertedMats)
         self.redrawPreviews()
         self.redrawList()
+    def shareCLUTs(self):
+        if self.batchConverter.isRunning(): return
+        clutsBefore, clutsAfter = shareCLUTs(self.convertedMats)
+        for matID in self.convertedMats:
+            self.previewCache.invalidate(matID)
+        self.window().statusBar().showMessage(f'Shared CLUTs, {clutsBefore} CLUTs reduced to {clutsAfter}')
+        self.redrawPreviews()
+        self.redrawList()
+    def listStatus(self, mat):
+        status = '🚫'
+        valid = '➖'
+        if mat in self.convertedMats:
+            status = '✅'
+            if self.convertedMats[mat].valid:
+                valid = '✅'
+            else:
+                valid = '🚫'
+        return valid, status
+    def clearCaches(self):
+        # Previews, thumbnails and generations of a project that is being replaced
+        self.previewCache.clear()
+        self.thumbIcons.clear()
+        self.thumbPending.clear()
+        self.lastGenerations.clear()
+    def thumbnailStamp(self, mat, kind):
+        # What a thumbnail is made from, when the stamp changes the thumbnail has to be regenerated
+        if kind == 'original':
+            if mat not in self.blender.data.mats: return None
+            texturePath = self.blender.data.mats[mat].texturePath
+            if not os.path.exists(texturePath): return None
+            return (texturePath, os.path.getmtime(texturePath))
+        if mat not in self.convertedMats or self.convertedMats[mat].type != 'T': return None
+        return self.convertedMats[mat].generation
+    def redrawThumbnails(self, item, mat):
+        # Use the known thumbnail if it is still current, otherwise ask the worker thread for a new one
+        for kind, column in (('original', 2), ('converted', 1)):
+            stamp = self.thumbnailStamp(mat, kind)
+            icon = QIcon()
+            known = self.thumbIcons.get((mat, kind))
+            if stamp != None and known != None and known[0] == stamp:
+                icon = known[1]
+            elif stamp != None and stamp not in self.thumbPending.get((mat, kind), []):
+                self.thumbPending.setdefault((mat, kind), []).append(stamp)
+                source = stamp[0] if kind == 'original' else self.convertedMats[mat].textureImg.copy()
+                self.thumbnails.request(mat, kind, source)
+            item.setIcon(column, icon)
+    def setThumbnail(self, mat, kind, thumbPath):
+        # The worker finishes requests in order, so the oldest pending stamp is the one this thumbnail is for
+        pending = self.thumbPending.get((mat, kind), [])
+        if len(pending) == 0: return
+        stamp = pending.pop(0)
+        # A failed thumbnail is asked for again the next time the item is redrawn
+        if thumbPath == '': return
+        if stamp != self.thumbnailStamp(mat, kind): return
+        icon = QIcon(thumbPath)
+        self.thumbIcons[(mat, kind)] = (stamp, icon)
+        for item in self.matList.findItems(mat, Qt.MatchExactly, 2):
+            item.setIcon({'original': 2, 'converted': 1}[kind], icon)
+    def redrawListItem(self, mat):
+        # Update the status columns of a single material without rebuilding the list (keeps the selection)
+        valid, status = self.listStatus(mat)
+        for item in self.matList.findItems(mat, Qt.MatchExactly, 2):
+            item.setText(0, valid)
+            item.setText(1, status)
+            self.redrawThumbnails(item, mat)
     def redrawList(self):
         self.matList.itemSelectionChanged.disconnect()
         self.matList.clear()
         for mat in self.blender.data.matIDs:
-            status = '🚫'
-            valid = '➖'
-            if mat in self.convertedMats:
-                status = '✅'
-                if self.convertedMats[mat].valid:
-                    valid = '✅'
-                else:
-                    valid = '🚫'
-            self.matList.addTopLevelItem(QTreeWidgetItem([valid, status, mat]))
+            valid, status = self.listStatus(mat)
+            item = QTreeWidgetItem([valid, status, mat])
+            self.matList.addTopLevelItem(item)
+            self.redrawThumbnails(item, mat)
         self.matList.sortItems(self.matList.header().sortIndicatorSection(), self.matList.header().sortIndicatorOrder())
         self.matList.itemSelectionChanged.connect(self.selectMat)
     def updatePage(self):
@@ -329,6 +329,12 @@ class Ui_TextureConverter(object):
         self.unconvertButton = QtWidgets.QPushButton(self.convertBox)
         self.unconvertButton.setObjectName("unconvertButton")
         self.convertBoxLayout.addWidget(self.unconvertButton)
+        self.cancelButton = QtWidgets.QPushButton(self.convertBox)
+        self.cancelButton.setObjectName("cancelButton")
+        self.convertBoxLayout.addWidget(self.cancelButton)
+        self.shareCLUTsButton = QtWidgets.QPushButton(self.convertBox)
+        self.shareCLUTsButton.setObjectName("shareCLUTsButton")
+        self.convertBoxLayout.addWidget(self.shareCLUTsButton)
         self.verticalLayout_7.addLayout(self.convertBoxLayout)
         self.conversionToolBoxLayout.addWidget(self.convertBox)
         self.horizontalLayout_2.addLayout(self.conversionToolBoxLayout)
@@ -452,6 +458,8 @@ class Ui_TextureConverter(object):
         self.convertBox.setTitle(_translate("TextureConverter", "Apply and Convert"))
         self.convertButton.setText(_translate("TextureConverter", "Convert!"))
         self.unconvertButton.setText(_translate("TextureConverter", "Unconvert"))
+        self.cancelButton.setText(_translate("TextureConverter", "Cancel"))
+        self.shareCLUTsButton.setText(_translate("TextureConverter", "Share CLUTs"))
         self.matListLabel.setText(_translate("TextureConverter", "Materials"))
         self.matList.setSortingEnabled(True)
         self.matList.headerItem().setText(0, _translate("TextureConverter", "Valid"))
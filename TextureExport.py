@@ -0,0 +1,117 @@
+# Standard imports
+import struct
+# Library imports
+import numpy as np
+import zstandard as zstd
+# Custom imports
+from VRAMModel import encodeTexture, encodeCLUT
+from HeaderWriter import HeaderWriter
+
+# Writers for the packed textures and CLUTs, shared by the VRAM packer tab and the headless pipeline
+
+def textureSymbol(matName):
+    safeName = ''.join([char for char in matName if char.isalnum()])
+    if not safeName[0].isalpha(): safeName = "m" + safeName
+    return safeName
+def textureRecords(convertedMats):
+    # (w, h, x, y, header, halfwords) of every packed texture and CLUT in BIN order, the halfwords are kept as
+    # a little endian array so writers can use its buffer without copying it into the header's bytes
+    for matName in convertedMats:
+        mat = convertedMats[matName]
+        if mat.type != 'T': continue
+        if not mat.packed: continue
+        yield mat.tpXSize, mat.ySize, mat.xPos, mat.yPos, struct.pack('<HHHH', mat.tpXSize, mat.ySize, mat.xPos, mat.yPos), np.ascontiguousarray(encodeTexture(mat), dtype='<u2')
+        if not mat.packedCLUT: continue
+        colorCount = {8: 256, 4: 16}[mat.colorMode]
+        yield colorCount, 1, mat.xPosCLUT, mat.yPosCLUT, struct.pack('<HHHH', colorCount, 1, mat.xPosCLUT, mat.yPosCLUT), np.ascontiguousarray(encodeCLUT(mat), dtype='<u2')
+def exportTextureBin(convertedMats, outputPath, outputName):
+    # Every texture and CLUT is a (w, h, x, y) header followed by its halfwords
+    outputFile = open(f'{outputPath}/{outputName}.BIN', 'wb')
+    for w, h, x, y, header, halfwords in textureRecords(convertedMats):
+        outputFile.write(header)
+        outputFile.write(halfwords)
+    outputFile.close()
+
+# Compressed BIN (.ZBIN). Each record of the plain BIN is its own zstd frame so any one texture can be read
+# back without the rest, the frames are fed to the compressor in chunks so big textures aren't copied again.
+#   Header: 'PSXZ', version, record count, index offset (u32)
+#   Frames: one per record, decompressing them in order gives the plain BIN
+#   Index:  (w, h, x, y, frame offset, frame size, record size) per record
+ZBIN_HEADER = struct.Struct('<4sHHI')
+ZBIN_INDEX = np.dtype([('w', '<u2'), ('h', '<u2'), ('x', '<u2'), ('y', '<u2'), ('offset', '<u4'), ('size', '<u4'), ('rawSize', '<u4')])
+def exportTextureArchive(convertedMats, outputPath, outputName, level = 10, chunkSize = 65536):
+    compressor = zstd.ZstdCompressor(level=level)
+    index = []
+    with open(f'{outputPath}/{outputName}.ZBIN', 'wb') as outputFile:
+        outputFile.write(bytes(ZBIN_HEADER.size))
+        for w, h, x, y, header, halfwords in textureRecords(convertedMats):
+            offset = outputFile.tell()
+            rawSize = len(header) + halfwords.nbytes
+            frame = compressor.compressobj(size=rawSize)
+            outputFile.write(frame.compress(header))
+            data = memoryview(halfwords).cast('B')
+            for start in range(0, len(data), chunkSize):
+                outputFile.write(frame.compress(data[start:start+chunkSize]))
+            outputFile.write(frame.flush())
+            index.append((w, h, x, y, offset, outputFile.tell()-offset, rawSize))
+        indexOffset = outputFile.tell()
+        outputFile.write(np.array(index, dtype=ZBIN_INDEX).tobytes())
+        outputFile.seek(0)
+        outputFile.write(ZBIN_HEADER.pack(b'PSXZ', 1, len(index), indexOffset))
+    return len(index)
+def readTextureIndex(path):
+    # Index entries of a .ZBIN as a ZBIN_INDEX array
+    with open(path, 'rb') as archiveFile:
+        magic, version, count, indexOffset = ZBIN_HEADER.unpack(archiveFile.read(ZBIN_HEADER.size))
+        if magic != b'PSXZ' or version != 1: raise ValueError(f'{path} is not a version 1 texture archive')
+        archiveFile.seek(indexOffset)
+        return np.frombuffer(archiveFile.read(count*ZBIN_INDEX.itemsize), dtype=ZBIN_INDEX)
+def extractTextureRecord(path, entry):
+    # Halfwords (h x w) of one index entry, only its frame is read and decompressed
+    with open(path, 'rb') as archiveFile:
+        archiveFile.seek(int(entry['offset']))
+        record = zstd.ZstdDecompressor().decompress(archiveFile.read(int(entry['size'])))
+    return np.frombuffer(record, dtype='<u2', offset=8).reshape(int(entry['h']), int(entry['w']))
+def exportTextureHeader(convertedMats, outputPath, outputName):
+    textureFile = HeaderWriter(f'{outputPath}/data_textures_{outputName}.h')
+    textureFile.write(f"#ifndef texture_{outputName}_h\n#define texture_{outputName}_h\n")
+    textureFile.write('#include "types_gfx.h"\n\n')
+    # Textures
+    for matName in convertedMats:
+        mat = convertedMats[matName]
+        if mat.type != 'T': continue
+        if not mat.packed: continue
+        safeName = textureSymbol(matName)
+        # Texture Data
+        textureFile.write(f'unsigned short {safeName}_texture[] = {{\n\t')
+        textureFile.writeValues(encodeTexture(mat))
+        textureFile.write('\n};\n')
+        # CLUT Data
+        if not mat.packedCLUT: continue
+        textureFile.write(f'unsigned short {safeName}_CLUT[] = {{\n\t')
+        textureFile.writeValues(encodeCLUT(mat))
+        textureFile.write('\n};\n')
+    writeTextureTable(textureFile, convertedMats, outputName)
+    textureFile.close()
+def writeTextureTable(textureFile, convertedMats, outputName):
+    # Table Data
+    textureFile.write(f'\nstruct Texture DAT_TEXTURES_{outputName}[] = {{\n')
+    textureCount = 0
+    for matName in convertedMats:
+        mat = convertedMats[matName]
+        if mat.type != 'T': continue
+        if not mat.packed: continue
+        safeName = textureSymbol(matName)
+        textureFile.write('\t{' + f'{mat.tpXSize}, {mat.ySize}, ')
+        textureFile.write(f'{mat.xPos}, {mat.yPos}, ')
+        textureFile.write(f'{safeName}_texture' + '},\n')
+        textureCount += 1
+        if not mat.packedCLUT: continue
+        colorCount = {8: 256, 4: 16}[mat.colorMode]
+        textureFile.write('\t{' + f'{colorCount}, {1}, ')
+        textureFile.write(f'{mat.xPosCLUT}, {mat.yPosCLUT}, ')
+        textureFile.write(f'{safeName}_CLUT' + '},\n')
+        textureCount += 1
+    textureFile.write('};\n\n')
+    textureFile.write(f'#define TEXTURE_LEN_{outputName} {textureCount}\n')
+    textureFile.write('#endif\n')
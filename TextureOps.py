@@ -0,0 +1,28 @@
+# Library imports
+import numpy as np
+from PIL import Image
+
+# Whole image pixel passes used by the texture converter, done on NumPy arrays
+# instead of walking every pixel with getpixel/putpixel
+
+NEAR_BLACK = 0b1000     # Value black pixels are replaced with so they dont become transparent on the PSX
+
+def imgToArray(image):
+    # Returns a writable HxWx3 uint8 copy of an RGB image
+    return np.array(image.convert("RGB"), dtype=np.uint8)
+def arrayToImg(pixels):
+    return Image.fromarray(np.ascontiguousarray(pixels, dtype=np.uint8))
+def truncate15BPP(pixels):
+    # Reduce to 5 bits per channel (15-bit color), keeping the values in the 0-255 range
+    return pixels & 0xF8
+def removeBlack(pixels):
+    # Pure black is transparent on the PSX so nudge it to the closest non transparent black
+    pixels = pixels.copy()
+    pixels[(pixels == 0).all(axis=2)] = NEAR_BLACK
+    return pixels
+def padWidth(pixels, width):
+    # Pad the right side of the image with black up to the given width
+    if pixels.shape[1] >= width: return pixels
+    padded = np.zeros((pixels.shape[0], width, 3), dtype=np.uint8)
+    padded[:, :pixels.shape[1]] = pixels
+    return padded
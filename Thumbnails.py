@@ -0,0 +1,62 @@
+# Standard imports
+import os, queue, hashlib
+# Library imports
+from PIL import Image
+from PyQt5.QtCore import QThread, pyqtSignal
+# Custom imports
+from Conversion import fileHash
+
+# Generates small list icons for original and converted textures on a worker thread. Thumbnails are stored
+# on disk as PNGs named after the hash of what they were made from, so they survive restarts and are shared
+# between materials using the same image. Only Pillow is used off the GUI thread, QIcons are made by the
+# receiver of thumbnailReady.
+
+class ThumbnailWorker(QThread):
+    thumbnailReady = pyqtSignal(str, str, str)      # Material ID, kind ('original' or 'converted'), thumbnail path ('' if it failed)
+    def __init__(self, thumbDir = './cache/thumbs', thumbSize = 32, parent = None):
+        super().__init__(parent)
+        self.thumbDir = thumbDir
+        self.thumbSize = thumbSize
+        self.jobs = queue.Queue()
+        self.fileHashes = {}        # (path, mtime) -> hash so unchanged originals are not rehashed
+        os.makedirs(self.thumbDir, exist_ok=True)
+    def request(self, matID, kind, source):
+        # source is a file path for originals and a Pillow image for converted textures
+        self.jobs.put((matID, kind, source))
+    def stop(self):
+        self.jobs.put(None)
+        self.wait()
+    def run(self):
+        while 1:
+            job = self.jobs.get()
+            if job == None: break
+            matID, kind, source = job
+            try:
+                thumbPath = self.makeThumbnail(kind, source)
+            except Exception as error:
+                print(f'Failed to make {kind} thumbnail for {matID}: {error}')
+                # Still answer the request so the receiver's pending requests stay in order
+                thumbPath = ''
+            self.thumbnailReady.emit(matID, kind, thumbPath)
+    def sourceHash(self, kind, source):
+        if kind == 'converted':
+            hasher = hashlib.sha256(source.mode.encode())
+            hasher.update(repr(source.size).encode())
+            hasher.update(source.tobytes())
+            if source.mode == 'P': hasher.update(bytes(source.getpalette()))
+            return hasher.hexdigest()
+        stamp = (source, os.path.getmtime(source))
+        if stamp not in self.fileHashes:
+            self.fileHashes[stamp] = fileHash(source)
+        return self.fileHashes[stamp]
+    def makeThumbnail(self, kind, source):
+        thumbPath = os.path.join(self.thumbDir, f'{self.sourceHash(kind, source)}_{self.thumbSize}.png')
+        if os.path.exists(thumbPath): return thumbPath
+        image = Image.open(source) if kind == 'original' else source
+        image = image.convert("RGBA")
+        # Nearest keeps converted textures looking like the PSX will show them
+        image.thumbnail((self.thumbSize, self.thumbSize), Image.NEAREST if kind == 'converted' else Image.BILINEAR)
+        tempPath = f'{thumbPath}.tmp.png'
+        image.save(tempPath)
+        os.replace(tempPath, thumbPath)
+        return thumbPath
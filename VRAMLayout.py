@@ -0,0 +1,425 @@
+# Standard imports
+import math, time, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+# Library imports
+import numpy as np
+# Custom imports
+from PaletteSharing import clutSource
+from Dedup import dedupTextures, textureSource
+from MaxRects import MaxRects, HEURISTICS, ORDERINGS, packRequests, packTrial
+
+# VRAM packing without touching any Qt widgets, shared by the VRAM packer tab and the headless pipeline
+
+class VRAMSettings:
+    def __init__(self):
+        self.bufWidth = 320             # Framebuffer width
+        self.bufHeight = 240            # Framebuffer height
+        self.bufX1 = 0                  # X position of framebuffer 1
+        self.bufY1 = 0                  # Y position of framebuffer 1
+        self.doubleBuffer = True        # Flag to reserve space for a second framebuffer
+        self.bufX2 = 0                  # X position of framebuffer 2
+        self.bufY2 = 240                # Y position of framebuffer 2
+
+def boxInside(xBox, yBox, wBox, hBox, xBin, yBin, wBin, hBin):
+    return (
+        xBox >= xBin and
+        yBox >= yBin and
+        (xBox + wBox) <= (xBin + wBin) and
+        (yBox + hBox) <= (yBin + hBin)
+    )
+def boxCollision(xBox, yBox, wBox, hBox, xBin, yBin, wBin, hBin):
+    # Check if one box is to the left of the other
+    if xBox + wBox <= xBin or xBin + wBin <= xBox:
+        return False
+
+    # Check if one box is above the other
+    if yBox + hBox <= yBin or yBin + hBin <= yBox:
+        return False
+
+    # If none of the conditions for being separated are met, the boxes collide
+    return True
+
+CLUT_WIDTHS = {4: 16, 8: 256}
+
+class OccupancyGrid:
+    # Summed-area table of how many items cover each halfword of VRAM, so testing whether a rect is free is
+    # four lookups no matter how many materials are packed. It is wider than VRAM because a texture page can
+    # reach past x 1024. Adding or removing a rect only updates the part of the table below and right of it.
+    def __init__(self, width = 1024+256, height = 512):
+        self.width = width
+        self.height = height
+        self.table = np.zeros((height+1, width+1), dtype=np.int32)
+    def add(self, x, y, w, h, amount = 1):
+        x0, x1 = min(max(x, 0), self.width), min(max(x+w, 0), self.width)
+        y0, y1 = min(max(y, 0), self.height), min(max(y+h, 0), self.height)
+        if x0 == x1 or y0 == y1: return
+        # Entry (Y, X) counts the covered halfwords above and left of it
+        rows = np.minimum(np.arange(1, self.height+1-y0), y1-y0)
+        cols = np.minimum(np.arange(1, self.width+1-x0), x1-x0)
+        self.table[y0+1:, x0+1:] += amount * rows[:, None] * cols[None, :]
+    def remove(self, x, y, w, h):
+        self.add(x, y, w, h, -1)
+    def fill(self, rects):
+        # Replaces the table with the given rects in one pass, each rect's corners go into a delta grid that
+        # two cumsums turn into per halfword coverage, two more give the summed-area table
+        rects = np.array(rects, dtype=np.int64).reshape(-1, 4)
+        x0 = np.clip(rects[:, 0], 0, self.width)
+        x1 = np.clip(rects[:, 0]+rects[:, 2], 0, self.width)
+        y0 = np.clip(rects[:, 1], 0, self.height)
+        y1 = np.clip(rects[:, 1]+rects[:, 3], 0, self.height)
+        deltas = np.zeros((self.height+1, self.width+1), dtype=np.int32)
+        for xs, ys, sign in ((x0, y0, 1), (x1, y0, -1), (x0, y1, -1), (x1, y1, 1)):
+            np.add.at(deltas, (ys, xs), sign)
+        coverage = deltas.cumsum(0, dtype=np.int32).cumsum(1, dtype=np.int32)[:self.height, :self.width]
+        self.table[:] = 0
+        self.table[1:, 1:] = coverage.cumsum(0, dtype=np.int32).cumsum(1, dtype=np.int32)
+    def freeMask(self, xs, ys, w, h):
+        # Returns a len(ys) x len(xs) mask of which w x h rects starting at the candidate positions are empty
+        table = self.table
+        x0 = np.clip(xs, 0, table.shape[1]-1)[None, :]
+        x1 = np.clip(xs+w, 0, table.shape[1]-1)[None, :]
+        y0 = np.clip(ys, 0, table.shape[0]-1)[:, None]
+        y1 = np.clip(ys+h, 0, table.shape[0]-1)[:, None]
+        covered = table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+        return covered == 0
+
+class VRAMLayout:
+    def __init__(self, convertedMats, settings):
+        self.convertedMats = convertedMats
+        self.settings = settings
+        self.rebuild()
+    def rebuild(self):
+        # Fill the occupancy grid from the framebuffers and everything already packed
+        self.grid = OccupancyGrid()
+        self.grid.fill(self.reservedRects())
+        self.stamp = self.occupancyStamp()
+    def occupancyStamp(self):
+        # Everything the grid is built from, if this changes the layout has to be rebuilt
+        stamp = [tuple(vars(self.settings).values())]
+        for matID, mat in self.convertedMats.items():
+            stamp.append((matID, mat.packed, mat.xPos, mat.yPos, mat.tpXSize, mat.ySize, mat.packedCLUT, mat.xPosCLUT, mat.yPosCLUT, mat.colorMode))
+        return stamp
+    def itemRect(self, mat, itemType):
+        if itemType == 'Texture':
+            return mat.xPos, mat.yPos, mat.tpXSize, mat.ySize
+        return mat.xPosCLUT, mat.yPosCLUT, CLUT_WIDTHS[mat.colorMode], 1
+    def isPacked(self, mat, itemType):
+        if itemType == 'Texture': return mat.packed
+        return mat.packedCLUT and mat.colorMode in CLUT_WIDTHS
+    def setPacked(self, itemID, itemType, packState):
+        # Pack or unpack an item at its current position, keeping the grid in sync
+        mat = self.convertedMats[itemID]
+        if self.isPacked(mat, itemType): self.grid.remove(*self.itemRect(mat, itemType))
+        if itemType == 'Texture':
+            mat.packed = packState
+        elif itemType == 'CLUT':
+            mat.packedCLUT = packState
+        if self.isPacked(mat, itemType): self.grid.add(*self.itemRect(mat, itemType))
+    def moveItem(self, itemID, itemType, x, y):
+        mat = self.convertedMats[itemID]
+        packed = self.isPacked(mat, itemType)
+        if packed: self.grid.remove(*self.itemRect(mat, itemType))
+        if itemType == 'Texture':
+            mat.xPos = x
+            mat.yPos = y
+        elif itemType == 'CLUT':
+            mat.xPosCLUT = x
+            mat.yPosCLUT = y
+        if packed: self.grid.add(*self.itemRect(mat, itemType))
+    def anyCollisions(self, x, y, w, h):
+        return not self.grid.freeMask(np.array([x]), np.array([y]), w, h)[0, 0]
+    def findTexturePackCoords(self, width, height, tpWidth):
+        # First fit scanning rows then columns in steps of 8, the texture must stay inside one texture page
+        # and inside VRAM
+        ys = np.arange(0, 512, 8)
+        xs = np.arange(0, 1024, 8)
+        tpYs = ys//256*256
+        tpXs = xs//64*64
+        fits = self.grid.freeMask(xs, ys, width, height)
+        fits &= (ys + height <= tpYs + 256)[:, None] & (width <= tpWidth)
+        fits &= (xs + width <= np.minimum(tpXs + tpWidth, 1024))[None, :]
+        found = np.flatnonzero(fits)
+        if len(found) == 0: return False, None, None
+        yIndex, xIndex = divmod(int(found[0]), len(xs))
+        return True, int(xs[xIndex]), int(ys[yIndex])
+    def findCLUTPackCoords(self, colorCount):
+        ys = np.arange(0, 512)
+        xs = np.arange(0, 1024, 16)
+        fits = self.grid.freeMask(xs, ys, colorCount, 1) & (xs + colorCount <= 1024)[None, :]
+        found = np.flatnonzero(fits)
+        if len(found) == 0: return False, None, None
+        yIndex, xIndex = divmod(int(found[0]), len(xs))
+        return True, int(xs[xIndex]), int(ys[yIndex])
+    def autoPackSingle(self, itemID, itemType):
+        # Returns True if the item was placed
+        mat = self.convertedMats[itemID]
+        if itemType == 'Texture':
+            tpWidth = {4: 64, 8: 128, 15: 256}[mat.colorMode]
+            status, xFound, yFound = self.findTexturePackCoords(mat.tpXSize, mat.ySize, tpWidth)
+        elif itemType == 'CLUT':
+            status, xFound, yFound = self.findCLUTPackCoords(CLUT_WIDTHS[mat.colorMode])
+        if status:
+            self.moveItem(itemID, itemType, xFound, yFound)
+            self.setPacked(itemID, itemType, True)
+        return status
+    def autoPackItems(self):
+        # The textures and CLUTs autoPackAll places, aliased textures and shared CLUTs use another item's space
+        items = []
+        for matKey in self.convertedMats:
+            mat = self.convertedMats[matKey]
+            # Materials with the same texture as another material share its VRAM
+            if mat.textureImg != None and textureSource(self.convertedMats, mat) is mat:
+                items.append((matKey, 'Texture'))
+        for matKey in self.convertedMats:
+            mat = self.convertedMats[matKey]
+            # Materials sharing another material's CLUT dont get one of their own
+            if mat.textureCLUT != None and clutSource(self.convertedMats, mat) is mat:
+                items.append((matKey, 'CLUT'))
+        return items
+    def unpackAll(self):
+        # Deduplicates and unpacks everything autoPackAll places, returns the items
+        self.dedupCounts = dedupTextures(self.convertedMats)
+        # Deduplicating unpacks the aliased textures
+        self.rebuild()
+        items = self.autoPackItems()
+        for itemID, itemType in items:
+            self.setPacked(itemID, itemType, False)
+        return items
+    def autoPackAll(self, strategy = 'maxRects', heuristic = 'bssf', budget = 3.0, workers = None):
+        # Returns the IDs of the textures and CLUTs that did not fit
+        # Everything being packed is placed again from scratch
+        items = self.unpackAll()
+        if strategy == 'firstFit':
+            return [(itemID, itemType) for itemID, itemType in items if not self.autoPackSingle(itemID, itemType)]
+        elif strategy == 'maxRects':
+            placements, largestFree = packRequests(self.reservedRects(), self.packRequests(items), heuristic=heuristic)
+            return self.applyPlacements(items, placements)
+        elif strategy == 'optimize':
+            return self.optimizePack(items, budget, workers)
+        raise ValueError(f'Unknown packing strategy "{strategy}"')
+    def optimizePack(self, items, budget, workers):
+        # Tries every ordering and heuristic, then randomly jittered orderings, in a process pool until the
+        # time budget runs out. Keeps the layout leaving the fewest items unpacked, then the one with the
+        # highest fill and then the most free contiguous space.
+        self.startOptimize(items, budget, workers)
+        wait(self.optimizeRun['futures'], timeout=max(self.optimizeRun['deadline'] - time.time(), 0))
+        return self.finishOptimize()
+    def startOptimize(self, items, budget = 3.0, workers = None):
+        # Starts the optimize trials for the unpacked items and returns straight away, optimizeDone() tells
+        # when finishOptimize() can be called without waiting
+        start = time.perf_counter()
+        deadline = time.time() + budget
+        reserved = self.reservedRects()
+        requests = self.packRequests(items)
+        # Trials still running at the deadline give up, so no worker outlives the budget
+        trials = [(f'{ordering}/{heuristic}', reserved, requests, ordering, heuristic, None, deadline) for ordering in ORDERINGS for heuristic in HEURISTICS]
+        trials += [(f'jitter{seed}/{heuristic}', reserved, requests, 'jitter', heuristic, seed, deadline) for seed in range(64) for heuristic in HEURISTICS]
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        futures = [executor.submit(packTrial, trial) for trial in trials]
+        # The default layout is packed here while the workers start up, so there is always a result
+        results = [('longestSide/bssf', *packRequests(reserved, requests))]
+        self.optimizeRun = {'start': start, 'deadline': deadline, 'items': items, 'requests': requests, 'executor': executor, 'futures': futures, 'results': results}
+    def optimizeDone(self):
+        run = self.optimizeRun
+        return time.time() >= run['deadline'] or all([future.done() for future in run['futures']])
+    def finishOptimize(self):
+        # Stops the trials, places the best layout found and returns the items that did not fit. The items
+        # have to be unpacked already, like autoPackAll does before packing.
+        run = self.optimizeRun
+        self.optimizeRun = None
+        for future in run['futures']:
+            future.cancel()
+        run['executor'].shutdown(wait=True)
+        results = run['results'] + [future.result() for future in run['futures'] if future.done() and not future.cancelled()]
+        requests = run['requests']
+        sizes = {request[0]: request[1]*request[2] for request in requests}
+        available = self.availableArea()
+        self.trials = []
+        for result in results:
+            if result == None: continue
+            name, placements, largestFree = result
+            packed = sum(sizes[key] for key in placements)
+            self.trials.append({'name': name, 'failed': len(requests) - len(placements), 'fill': packed/available, 'largestFree': largestFree, 'placements': placements})
+        self.trials.sort(key=lambda trial: (-trial['failed'], trial['fill'], trial['largestFree']), reverse=True)
+        self.optimizeTime = time.perf_counter() - run['start']
+        # Materials may have been converted, reconverted or unconverted from another tab while the trials ran,
+        # only placements of items that still have the size they were planned with are kept
+        items = self.autoPackItems()
+        planned = {request[0]: request[1:3] for request in requests}
+        placements = {request[0]: self.trials[0]['placements'][request[0]] for request in self.packRequests(items)
+            if request[0] in self.trials[0]['placements'] and planned[request[0]] == request[1:3]}
+        leftover = self.applyPlacements(items, placements)
+        # Everything else goes into the space the best layout left
+        placements, largestFree = packRequests(self.reservedRects(), self.packRequests(leftover))
+        return self.applyPlacements(leftover, placements)
+    def autoPackUnpacked(self, heuristic = 'bssf'):
+        # Places only unpacked (new or resized) items and leaves everything already packed where it is, as
+        # runtime code and save data refer to those coordinates. If something doesn't fit in the space left
+        # the fewest packed items are moved to make room. Returns the items that still did not fit, the
+        # items that were moved are left in movedItems.
+        # Deduplicating keeps the packed copy of a texture or CLUT so nothing that is packed gets unpacked
+        self.dedupCounts = dedupTextures(self.convertedMats, keepPacked=True)
+        self.rebuild()
+        items = self.autoPackItems()
+        # Packed items that are no longer valid where they are (moved framebuffers, hand placed across a
+        # texture page, overlapping another item) are placed again too
+        for itemID, itemType in items:
+            mat = self.convertedMats[itemID]
+            if not self.isPacked(mat, itemType): continue
+            x, y, w, h = self.itemRect(mat, itemType)
+            self.setPacked(itemID, itemType, False)
+            if self.fitsAt(mat, itemType, x, y) and not self.anyCollisions(x, y, w, h):
+                self.setPacked(itemID, itemType, True)
+        pending = [item for item in items if not self.isPacked(self.convertedMats[item[0]], item[1])]
+        placements, largestFree = packRequests(self.reservedRects(), self.packRequests(pending), heuristic=heuristic)
+        failed = self.applyPlacements(pending, placements)
+        self.movedItems = []
+        pinned = set(items) - set(pending)
+        stillFailed = []
+        for item in failed:
+            moved = self.makeRoom(item, pinned, heuristic)
+            if moved == None:
+                stillFailed.append(item)
+                continue
+            pinned -= set(moved)
+            self.movedItems += moved
+        return stillFailed
+    def makeRoom(self, item, movable, heuristic, attempts = 8):
+        # Puts item where it covers the fewest movable items and packs those again in the space left. Tries
+        # the next cheapest spots if they don't fit and returns the moved items, or None leaving VRAM as it was.
+        itemID, itemType = item
+        mat = self.convertedMats[itemID]
+        w, h = self.itemRect(mat, itemType)[2:]
+        if itemType == 'Texture':
+            xs, ys = np.arange(0, 1024, 8), np.arange(0, 512, 8)
+        else:
+            xs, ys = np.arange(0, 1024, 16), np.arange(0, 512)
+        valid = self.fitsAt(mat, itemType, xs[None, :], ys[:, None])
+        # Space taken by anything that can't move is off limits
+        fixed = OccupancyGrid()
+        covered = np.zeros(valid.shape, dtype=np.int64)
+        coveredArea = np.zeros(valid.shape, dtype=np.int64)
+        for rect in self.bufferRects():
+            fixed.add(*rect)
+        for other in self.autoPackItems():
+            otherMat = self.convertedMats[other[0]]
+            if not self.isPacked(otherMat, other[1]): continue
+            x, y, rw, rh = self.itemRect(otherMat, other[1])
+            if other not in movable:
+                fixed.add(x, y, rw, rh)
+                continue
+            overlaps = ((ys < y+rh) & (y < ys+h))[:, None] & ((xs < x+rw) & (x < xs+w))[None, :]
+            covered += overlaps
+            coveredArea += overlaps * (rw*rh)
+        valid &= fixed.freeMask(xs, ys, w, h)
+        if not valid.any(): return None
+        # Cheapest spots first: fewest items to move, then the least area to move
+        cost = (covered * (1024*512) + coveredArea).ravel()
+        candidates = np.flatnonzero(valid.ravel())
+        for index in candidates[np.argsort(cost[candidates], kind='stable')][:attempts]:
+            yIndex, xIndex = divmod(int(index), len(xs))
+            x, y = int(xs[xIndex]), int(ys[yIndex])
+            start = self.savePositions()
+            moved = []
+            for other in movable:
+                otherMat = self.convertedMats[other[0]]
+                if not self.isPacked(otherMat, other[1]): continue
+                if boxCollision(x, y, w, h, *self.itemRect(otherMat, other[1])):
+                    self.setPacked(*other, False)
+                    moved.append(other)
+            self.moveItem(itemID, itemType, x, y)
+            self.setPacked(itemID, itemType, True)
+            placements, largestFree = packRequests(self.reservedRects(), self.packRequests(moved), heuristic=heuristic)
+            if len(placements) == len(moved):
+                self.applyPlacements(moved, placements)
+                return moved
+            self.restorePositions(start)
+        return None
+    def fitsAt(self, mat, itemType, x, y):
+        # If the item is inside VRAM at x, y with textures inside one texture page and CLUTs 16 aligned, also
+        # works on arrays of positions. Tiled textures have to be on the 8 halfword grid of the tile window.
+        w, h = self.itemRect(mat, itemType)[2:]
+        inside = (x >= 0) & (y >= 0) & (x + w <= 1024) & (y + h <= 512)
+        if itemType == 'Texture':
+            tpWidth = {4: 64, 8: 128, 15: 256}[mat.colorMode]
+            if mat.tiled: inside = inside & (x % 8 == 0) & (y % 8 == 0)
+            return inside & (x + w <= x//64*64 + tpWidth) & (y//256 == (y + h - 1)//256)
+        return inside & (x % 16 == 0)
+    def packRequests(self, items):
+        requests = []
+        for itemID, itemType in items:
+            mat = self.convertedMats[itemID]
+            w, h = self.itemRect(mat, itemType)[2:]
+            # Textures stay on the 8 halfword grid the tile window offsets are given in, like first-fit
+            if itemType == 'Texture':
+                requests.append(((itemID, itemType), w, h, {4: 64, 8: 128, 15: 256}[mat.colorMode], 8, 8))
+            else:
+                requests.append(((itemID, itemType), w, h, None, 16, 1))
+        return requests
+    def applyPlacements(self, items, placements):
+        for item in items:
+            if item not in placements: continue
+            self.moveItem(*item, *placements[item])
+            self.setPacked(*item, True)
+        return [item for item in items if item not in placements]
+    def bufferRects(self):
+        settings = self.settings
+        rects = [(settings.bufX1, settings.bufY1, settings.bufWidth, settings.bufHeight)]
+        if settings.doubleBuffer:
+            rects.append((settings.bufX2, settings.bufY2, settings.bufWidth, settings.bufHeight))
+        return rects
+    def reservedRects(self):
+        # The framebuffers and every packed item
+        rects = self.bufferRects()
+        for mat in self.convertedMats.values():
+            for itemType in ('Texture', 'CLUT'):
+                if self.isPacked(mat, itemType): rects.append(self.itemRect(mat, itemType))
+        return rects
+    def freeSpace(self):
+        # MaxRects free list of the VRAM not taken by the framebuffers or packed items
+        space = MaxRects()
+        for rect in self.reservedRects():
+            space.occupy(*rect)
+        return space
+    def availableArea(self):
+        # VRAM outside the framebuffers
+        buffers = np.zeros((512, 1024), dtype=bool)
+        for x, y, w, h in self.bufferRects():
+            buffers[max(y, 0):max(y+h, 0), max(x, 0):max(x+w, 0)] = True
+        return buffers.size - int(buffers.sum())
+    def fillStats(self):
+        # How much of the VRAM outside the framebuffers is packed and the biggest block still free
+        available = self.availableArea()
+        packed = 0
+        for mat in self.convertedMats.values():
+            for itemType in ('Texture', 'CLUT'):
+                if self.isPacked(mat, itemType):
+                    w, h = self.itemRect(mat, itemType)[2:]
+                    packed += w*h
+        return {'packed': packed, 'available': available, 'fill': packed/available, 'largestFree': self.freeSpace().largestFree()}
+    def savePositions(self):
+        # Positions and the texture and CLUT sharing dedupTextures changes while packing
+        return {matID: (mat.packed, mat.xPos, mat.yPos, mat.packedCLUT, mat.xPosCLUT, mat.yPosCLUT, mat.textureAlias, mat.clutGroup, mat.clutOwner)
+            for matID, mat in self.convertedMats.items()}
+    def restorePositions(self, positions):
+        for matID, position in positions.items():
+            mat = self.convertedMats[matID]
+            mat.packed, mat.xPos, mat.yPos, mat.packedCLUT, mat.xPosCLUT, mat.yPosCLUT, mat.textureAlias, mat.clutGroup, mat.clutOwner = position
+        self.rebuild()
+    def comparePacking(self, strategy = 'maxRects', baseline = 'firstFit', **options):
+        # Packs with the baseline strategy to measure against, then again from the same start with strategy
+        start = self.savePositions()
+        baseFailed = self.autoPackAll(baseline)
+        baseStats = self.fillStats()
+        self.restorePositions(start)
+        failed = self.autoPackAll(strategy, **options)
+        return failed, self.fillStats(), baseFailed, baseStats
+
+def describeGain(stats, baseStats):
+    return (f'fill {stats["fill"]*100:.1f}% ({(stats["fill"]-baseStats["fill"])*100:+.1f}% over first-fit), '
+        f'largest free block {stats["largestFree"]} halfwords (first-fit {baseStats["largestFree"]})')
+def describeTrials(trials, count = 5):
+    lines = [f'{len(trials)} layouts tried, best {min(count, len(trials))}:']
+    for trial in trials[:count]:
+        lines.append(f'    {trial["name"]:<20} fill {trial["fill"]*100:5.1f}%  largest free {trial["largestFree"]:6d}  failed {trial["failed"]}')
+    return '\n'.join(lines)
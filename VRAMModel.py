@@ -0,0 +1,77 @@
+# Library imports
+import numpy as np
+
+# The contents of VRAM as the PSX will see them, a 1024x512 array of the encoded halfwords of every packed
+# texture and CLUT. sync() compares the packed items with what the array holds and only encodes and copies
+# the rects that changed, so the whole of VRAM (or any part of it) can be dumped with a single write.
+
+def encode15BPP(rgb):
+    # Array of RGB(A) pixels to PSX 15-bit halfwords, bit 15 (semi transparency) is left clear
+    rgb = rgb.astype(np.uint16) >> 3
+    return (rgb[..., 2] << 10) | (rgb[..., 1] << 5) | rgb[..., 0]
+def encodeTexture(mat):
+    # Halfwords of a converted texture, tpXSize wide and ySize tall
+    if mat.colorMode == 15:
+        pixels = np.asarray(mat.textureImg)[:mat.ySize, :mat.xSize]
+        return encode15BPP(pixels)
+    indices = np.asarray(mat.textureImg)[:mat.ySize].astype(np.uint16)
+    perWord = {8: 2, 4: 4}[mat.colorMode]
+    bits = 16 // perWord
+    words = np.zeros((mat.ySize, mat.tpXSize), dtype=np.uint16)
+    for pixel in range(perWord):
+        words |= indices[:, pixel:mat.tpXSize*perWord:perWord] << (pixel*bits)
+    return words
+def encodeCLUT(mat):
+    colorCount = {8: 256, 4: 16}[mat.colorMode]
+    return encode15BPP(np.asarray(mat.textureCLUT)[:1, :colorCount])
+
+class VRAMModel:
+    def __init__(self):
+        self.words = np.zeros((512, 1024), dtype=np.uint16)
+        self.items = {}             # Item key -> (x, y, w, h, stamp) of what words holds
+        self.encoded = {}           # Item key -> (stamp, halfwords)
+    def currentItems(self, convertedMats):
+        # Every packed texture and CLUT in the order they are written, the stamp changes when the pixels do
+        items = {}
+        for matID in convertedMats:
+            mat = convertedMats[matID]
+            if mat.type != 'T': continue
+            if mat.packed:
+                items[(matID, 'Texture')] = (mat.xPos, mat.yPos, mat.tpXSize, mat.ySize, (mat.generation, id(mat.textureImg)))
+            if mat.packedCLUT and mat.textureCLUT != None:
+                items[(matID, 'CLUT')] = (mat.xPosCLUT, mat.yPosCLUT, {8: 256, 4: 16}[mat.colorMode], 1, (mat.generation, id(mat.textureCLUT)))
+        return items
+    def itemWords(self, convertedMats, key, stamp):
+        if key not in self.encoded or self.encoded[key][0] != stamp:
+            mat = convertedMats[key[0]]
+            self.encoded[key] = (stamp, encodeTexture(mat) if key[1] == 'Texture' else encodeCLUT(mat))
+        return self.encoded[key][1]
+    def sync(self, convertedMats):
+        # Brings words up to date, returns the (x, y, w, h) rects that changed
+        items = self.currentItems(convertedMats)
+        dirty = []
+        for key in self.items.keys() | items.keys():
+            old = self.items.get(key)
+            new = items.get(key)
+            if old == new: continue
+            if old != None: dirty.append(old[:4])
+            if new != None: dirty.append(new[:4])
+        self.items = items
+        self.encoded = {key: value for key, value in self.encoded.items() if key in items}
+        for dx, dy, dw, dh in dirty:
+            self.words[max(dy, 0):dy+dh, max(dx, 0):dx+dw] = 0
+            # Everything overlapping the rect is copied again in order so overlaps end up as they would in VRAM
+            for key, (x, y, w, h, stamp) in items.items():
+                x0, x1 = max(x, dx, 0), min(x+w, dx+dw, 1024)
+                y0, y1 = max(y, dy, 0), min(y+h, dy+dh, 512)
+                if x0 >= x1 or y0 >= y1: continue
+                words = self.itemWords(convertedMats, key, stamp)
+                self.words[y0:y1, x0:x1] = words[y0-y:y1-y, x0-x:x1-x]
+        return dirty
+    def rect(self, x, y, w, h):
+        return self.words[y:y+h, x:x+w]
+    def dump(self, path, rect = None):
+        # Writes all of VRAM, or an (x, y, w, h) rect of it, as raw little endian halfwords in one write
+        words = self.words if rect == None else self.rect(*rect)
+        with open(path, 'wb') as dumpFile:
+            dumpFile.write(words.astype('<u2').tobytes())
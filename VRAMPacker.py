@@ -1,12 +1,16 @@
-# Standard imports
-import math, struct
 # Library imports
 from PyQt5.QtWidgets import *
-from PyQt5.QtCore import Qt, QSize
-from PyQt5.QtGui import QImage, QPainter, QPen, QColor, QMouseEvent
+from PyQt5.QtCore import Qt, QSize, QRect, QRectF, QTimer
+from PyQt5.QtGui import QImage, QPainter, QPen, QColor, QMouseEvent, QRegion
 # Custom imports
 from BlenderState import BlenderStateManager
 from ConvertedMat import ConvertedMat
+from PaletteSharing import clutSource
+from Dedup import textureSource
+from VRAMLayout import VRAMSettings, VRAMLayout, describeGain, describeTrials
+from TextureExport import exportTextureBin, exportTextureHeader, exportTextureArchive
+from VRAMModel import VRAMModel
+from BlobExport import exportTextureBlob
 # Generated imports
 from VRAMPackerGen import Ui_VRAMPacker
 
@@ -18,6 +22,10 @@ class VRAMPackerTab(QWidget, Ui_VRAMPacker):
         # Tab state
         self.selectedItemID = None
         self.selectedItemType = None
+        self.packBudget = 3.0               # Seconds Optimize Pack All may spend trying layouts
+        self.vramModel = VRAMModel()        # Encoded halfwords of everything packed, kept in sync by updatePage
+        self.packLayout = None              # Occupancy of VRAM, kept between edits made on this tab
+        self.optimizeBase = None            # First-fit result Optimize Pack All is measured against while it runs
         # Setup tab
         super().__init__()
         self.setupUi(self)
@@ -25,22 +33,31 @@ class VRAMPackerTab(QWidget, Ui_VRAMPacker):
         self.VRAMScrollArea.setWidget(self.VRAMViewer)
         self.itemList.header().setSectionResizeMode(QHeaderView.ResizeToContents)
         self.itemList.sortItems(3, Qt.AscendingOrder)
+        self.optimizeTimer = QTimer(self)
+        self.optimizeTimer.setInterval(50)
+        self.optimizeTimer.timeout.connect(self.pollOptimize)
         # Setup custom signals
         self.exportBinButton.clicked.connect(self.exportBin)
         self.exportHeaderButton.clicked.connect(self.exportHeader)
+        self.exportDumpButton.clicked.connect(self.exportDump)
+        self.exportBlobButton.clicked.connect(self.exportBlob)
+        self.exportZBinButton.clicked.connect(self.exportZBin)
         self.packSelectedButton.clicked.connect(lambda: self.packSelected(True))
         self.unpackSelectedButton.clicked.connect(lambda: self.packSelected(False))
         self.itemList.itemSelectionChanged.connect(self.selectItemList)
         self.autopackSelectedButton.clicked.connect(self.autoPackSelected)
-        self.autopackAllButton.clicked.connect(self.autoPackAll)
+        self.autopackAllButton.clicked.connect(lambda: self.autoPackAll('maxRects'))
+        self.optimizePackButton.clicked.connect(self.startOptimize)
+        self.autopackUnpackedButton.clicked.connect(self.autoPackUnpacked)
         self.selectedXSpin.valueChanged.connect(self.updateItemSpin)
         self.selectedYSpin.valueChanged.connect(self.updateItemSpin)
-        self.bufferWidthSelector.currentTextChanged.connect(self.VRAMViewer.repaint)
-        self.bufferHeightSelector.currentTextChanged.connect(self.VRAMViewer.repaint)
-        self.buffer1XPosSelector.valueChanged.connect(self.VRAMViewer.repaint)
-        self.buffer1YPosSelector.valueChanged.connect(self.VRAMViewer.repaint)
-        self.buffer2XPosSelector.valueChanged.connect(self.VRAMViewer.repaint)
-        self.buffer2YPosSelector.valueChanged.connect(self.VRAMViewer.repaint)
+        self.bufferWidthSelector.currentTextChanged.connect(self.VRAMViewer.update)
+        self.bufferHeightSelector.currentTextChanged.connect(self.VRAMViewer.update)
+        self.buffer1XPosSelector.valueChanged.connect(self.VRAMViewer.update)
+        self.buffer1YPosSelector.valueChanged.connect(self.VRAMViewer.update)
+        self.buffer2XPosSelector.valueChanged.connect(self.VRAMViewer.update)
+        self.buffer2YPosSelector.valueChanged.connect(self.VRAMViewer.update)
+        self.doubleBufferCheck.stateChanged.connect(self.VRAMViewer.update)
     def selectItemList(self):
         if len(self.itemList.selectedItems()) == 0: return
         self.selectedItemID = self.itemList.selectedItems()[0].text(3)
@@ -67,124 +84,110 @@ class VRAMPackerTab(QWidget, Ui_VRAMPacker):
         self.selectedYSpin.setValue(yPos)
     def packSelected(self, packState):
         if self.selectedItemID == None: return
-        mat = self.convertedMats[self.selectedItemID]
-        if self.selectedItemType == 'Texture':
-            mat.packed = packState
-        elif self.selectedItemType == 'CLUT':
-            mat.packedCLUT = packState
+        self.vramLayout().setPacked(self.selectedItemID, self.selectedItemType, packState)
+        self.layoutEdited()
         self.selectItemList()
         self.updatePage()
-    def boxInside(self, xBox, yBox, wBox, hBox, xBin, yBin, wBin, hBin):
-        return (
-            xBox >= xBin and
-            yBox >= yBin and
-            (xBox + wBox) <= (xBin + wBin) and
-            (yBox + hBox) <= (yBin + hBin)
-        )
-    def boxCollision(self, xBox, yBox, wBox, hBox, xBin, yBin, wBin, hBin):
-        # Check if one box is to the left of the other
-        if xBox + wBox <= xBin or xBin + wBin <= xBox:
-            return False
-
-        # Check if one box is above the other
-        if yBox + hBox <= yBin or yBin + hBin <= yBox:
-            return False
-
-        # If none of the conditions for being separated are met, the boxes collide
-        return True
-    def anyCollisions(self, x, y, w, h):
-        # TODO Check collisions with framebuffer(s)
-        bufWidth = int(self.bufferWidthSelector.currentText())
-        bufHeight = int(self.bufferHeightSelector.currentText())
-        bufX1 = self.buffer1XPosSelector.value()
-        bufY1 = self.buffer1YPosSelector.value()
-        if self.boxCollision(x, y, w, h, bufX1, bufY1, bufWidth, bufHeight):
-            return True, bufX1+bufWidth
-        if self.doubleBufferCheck.isChecked():
-            bufX2 = self.buffer2XPosSelector.value()
-            bufY2 = self.buffer2YPosSelector.value()
-            if self.boxCollision(x, y, w, h, bufX2, bufY2, bufWidth, bufHeight):
-                return True, bufX2+bufWidth
-        for matKey in self.convertedMats:
-            mat = self.convertedMats[matKey]
-            if mat.packed:
-                if self.boxCollision(x, y, w, h, mat.xPos, mat.yPos, mat.tpXSize, mat.ySize):
-                    return True, mat.xPos+mat.tpXSize
-            if mat.packedCLUT:
-                colorCount = {4: 16, 8: 256}[mat.colorMode]
-                if self.boxCollision(x, y, w, h, mat.xPosCLUT, mat.yPosCLUT, colorCount, 1):
-                    return True, mat.xPosCLUT+colorCount
-        return False, 0
-    def findTexturePackCoords(self, width, height, tpWidth):
-        for y in range(0, 512, 8):
-            tpY = math.floor(y/256)*256
-            if not self.boxInside(0, y, width, height, 0, tpY, tpWidth, 256):
-                y = tpY + 256 - 8
-                continue
-            for x in range(0, 1024, 8):
-                tpX = math.floor(x/64)*64
-                if not self.boxInside(x, y, width, height, tpX, tpY, tpWidth, 256):
-                    x = tpX + tpWidth - 8
-                    continue
-                collisions, nextXPos = self.anyCollisions(x, y, width, height)
-                if not collisions:
-                    return (True, x, y)
-                else:
-                    x = nextXPos-8
-        return False, None, None
-    def findCLUTPackCoords(self, colorCount):
-        for y in range(0, 512, 1):
-            for x in range(0, 1024, 16):
-                if not self.boxInside(x, y, colorCount, 1, 0, 0, 1024, 512):
-                    continue
-                collisions, nextXPos = self.anyCollisions(x, y, colorCount, 1)
-                if not collisions:
-                    return True, x, y
-                else:
-                    x = nextXPos-16
-        return False, None, None
+    def snapshotSettings(self):
+        # Copy the framebuffer setup out of the widgets
+        settings = VRAMSettings()
+        settings.bufWidth = int(self.bufferWidthSelector.currentText())
+        settings.bufHeight = int(self.bufferHeightSelector.currentText())
+        settings.bufX1 = self.buffer1XPosSelector.value()
+        settings.bufY1 = self.buffer1YPosSelector.value()
+        settings.doubleBuffer = self.doubleBufferCheck.isChecked()
+        settings.bufX2 = self.buffer2XPosSelector.value()
+        settings.bufY2 = self.buffer2YPosSelector.value()
+        return settings
+    def vramLayout(self):
+        # Edits on this tab keep the layout's grid up to date, it is only rebuilt when the framebuffers changed
+        # or materials were converted, unconverted or moved from another tab
+        settings = self.snapshotSettings()
+        if self.packLayout == None:
+            self.packLayout = VRAMLayout(self.convertedMats, settings)
+        self.packLayout.settings = settings
+        if self.packLayout.stamp != self.packLayout.occupancyStamp(): self.packLayout.rebuild()
+        return self.packLayout
+    def layoutEdited(self):
+        # Called after the tab changed the layout through it, so the changes don't count as outside ones
+        self.packLayout.stamp = self.packLayout.occupancyStamp()
     def autoPackSingle(self, itemID, itemType):
         if itemID == None: return
-        mat = self.convertedMats[itemID]
-        if itemType == 'Texture':
-            tpWidth = {4: 64, 8: 128, 15: 256}[mat.colorMode]
-            status, xFound, yFound = self.findTexturePackCoords(mat.tpXSize, mat.ySize, tpWidth)
-            if status:
-                mat.packed = True
-                mat.xPos = xFound
-                mat.yPos = yFound
-        elif itemType == 'CLUT':
-            status, xFound, yFound = self.findCLUTPackCoords({4: 16, 8: 256}[mat.colorMode])
-            if status:
-                mat.packedCLUT = True
-                mat.xPosCLUT = xFound
-                mat.yPosCLUT = yFound
+        self.vramLayout().autoPackSingle(itemID, itemType)
+        self.layoutEdited()
         self.selectItemList()
         self.updatePage()
     def autoPackSelected(self):
         self.autoPackSingle(self.selectedItemID, self.selectedItemType)
-    def autoPackAll(self):
-        for matKey in self.convertedMats:
-            mat = self.convertedMats[matKey]
-            if mat.textureImg != None:
-                self.autoPackSingle(matKey, 'Texture')
-        for matKey in self.convertedMats:
-            mat = self.convertedMats[matKey]
-            if mat.textureCLUT != None:
-                self.autoPackSingle(matKey, 'CLUT')
+    def autoPackAll(self, strategy = 'maxRects'):
+        if strategy == 'optimize': return self.startOptimize()
+        layout = self.vramLayout()
+        # Also pack with the old first-fit scan to show what MaxRects gains over it
+        failed, stats, baseFailed, baseStats = layout.comparePacking(strategy)
+        self.layoutEdited()
+        self.showPackResult(strategy, failed, stats, baseFailed, baseStats)
+    def startOptimize(self):
+        # The trials run in worker processes while the tab keeps showing the current layout, pollOptimize
+        # places the best one when they are done
+        if self.optimizeTimer.isActive(): return
+        layout = self.vramLayout()
+        start = layout.savePositions()
+        baseFailed = layout.autoPackAll('firstFit')
+        self.optimizeBase = (baseFailed, layout.fillStats())
+        layout.restorePositions(start)
+        layout.startOptimize(layout.unpackAll(), self.packBudget)
+        layout.restorePositions(start)
+        self.layoutEdited()
+        self.setPackingEnabled(False)
+        self.window().statusBar().showMessage(f'Trying layouts for {self.packBudget:.0f} seconds...')
+        self.optimizeTimer.start()
+    def pollOptimize(self):
+        if not self.packLayout.optimizeDone(): return
+        self.optimizeTimer.stop()
+        layout = self.vramLayout()
+        layout.unpackAll()
+        failed = layout.finishOptimize()
+        self.layoutEdited()
+        self.setPackingEnabled(True)
+        baseFailed, baseStats = self.optimizeBase
+        self.optimizeBase = None
+        self.showPackResult('optimize', failed, layout.fillStats(), baseFailed, baseStats)
+    def setPackingEnabled(self, enabled):
+        # Nothing on the tab may move items or the framebuffers while optimize trials run
+        for widget in (self.autoPackerBox, self.manualPositionBox, self.frameConfigBox, self.packSelectedButton, self.unpackSelectedButton):
+            widget.setEnabled(enabled)
+    def showPackResult(self, strategy, failed, stats, baseFailed, baseStats):
+        layout = self.packLayout
+        textureDupes, clutDupes = layout.dedupCounts
+        message = describeGain(stats, baseStats)
+        if strategy == 'optimize':
+            print(describeTrials(layout.trials))
+            message = f'Best of {len(layout.trials)} layouts ({layout.trials[0]["name"]}): {message}'
+        if len(failed) != 0:
+            message = f'{len(failed)} items did not fit in VRAM (first-fit {len(baseFailed)}), {message}'
+        if textureDupes + clutDupes != 0:
+            message = f'{message}, shared {textureDupes} duplicate textures and {clutDupes} duplicate CLUTs'
+        self.window().statusBar().showMessage(message)
+        self.selectItemList()
+        self.updatePage()
+    def autoPackUnpacked(self):
+        layout = self.vramLayout()
+        failed = layout.autoPackUnpacked()
+        self.layoutEdited()
+        message = f'Moved {len(layout.movedItems)} packed items to make room' if layout.movedItems else 'No packed items were moved'
+        if len(failed) != 0:
+            message = f'{len(failed)} items did not fit in VRAM, {message.lower()}'
+        self.window().statusBar().showMessage(message)
+        self.selectItemList()
+        self.updatePage()
     def unPackAll(self):
         pass
     def updateItemSpin(self):
         if self.selectedItemID == None: return
         xPos = self.selectedXSpin.value()
         yPos = self.selectedYSpin.value()
-        mat = self.convertedMats[self.selectedItemID]
-        if self.selectedItemType == 'Texture':
-            mat.xPos = xPos
-            mat.yPos = yPos
-        elif self.selectedItemType == 'CLUT':
-            mat.xPosCLUT = xPos
-            mat.yPosCLUT = yPos
+        self.vramLayout().moveItem(self.selectedItemID, self.selectedItemType, xPos, yPos)
+        self.layoutEdited()
         self.selectItemList()
         self.updatePage()
     def redrawList(self):
@@ -205,9 +208,12 @@ class VRAMPackerTab(QWidget, Ui_VRAMPacker):
             item = QTreeWidgetItem([valid, packed, "Texture", matName])
             if valid == '🚫':
                 item.setFlags(item.flags() & ~Qt.ItemIsEnabled)
-            self.itemList.addTopLevelItem(item)
+            # Materials with a duplicate texture use the VRAM of the material they alias
+            if textureSource(self.convertedMats, mat) is mat:
+                self.itemList.addTopLevelItem(item)
             # CLUT
             if mat.textureCLUT == None: continue
+            if clutSource(self.convertedMats, mat) is not mat: continue
             if mat.packedCLUT:
                 packed = '✅'
             else:
@@ -219,129 +225,20 @@ class VRAMPackerTab(QWidget, Ui_VRAMPacker):
         self.itemList.sortItems(self.itemList.header().sortIndicatorSection(), self.itemList.header().sortIndicatorOrder())
         self.itemList.itemSelectionChanged.connect(self.selectItemList)
     def exportBin(self):
-        outputName = "MATS1"
-        outputPath = "./DummyPath/"
-        outputFile = open(f'{outputPath}/{outputName}.BIN', 'wb')
-        for matName in self.convertedMats:
-            mat = self.convertedMats[matName]
-            if mat.type != 'T': continue
-            if not mat.packed: continue
-            outputFile.write(struct.pack('<HHHH', mat.tpXSize, mat.ySize, mat.xPos, mat.yPos))
-            if mat.colorMode == 15:
-                for y in range(mat.ySize):
-                    for x in range(mat.xSize):
-                        pixRGB = mat.textureImg.getpixel((x, y))
-                        pixR = pixRGB[0] >> 3
-                        pixG = pixRGB[1] >> 3
-                        pixB = pixRGB[2] >> 3
-                        pixTotal = (pixB << 10) + (pixG << 5) + (pixR)
-                        outputFile.write(struct.pack('<H', pixTotal))
-            elif mat.colorMode == 8:
-                for y in range(mat.ySize):
-                    for x in range(mat.tpXSize):
-                        pix0 = mat.textureImg.getpixel((x*2, y))
-                        pix1 = mat.textureImg.getpixel((x*2+1, y))
-                        pixTotal = (pix1 << 8) + pix0
-                        outputFile.write(struct.pack('<H', pixTotal))
-            elif mat.colorMode == 4:
-                for y in range(mat.ySize):
-                    for x in range(mat.tpXSize):
-                        pix0 = mat.textureImg.getpixel((x*4, y))
-                        pix1 = mat.textureImg.getpixel((x*4+1, y))
-                        pix2 = mat.textureImg.getpixel((x*4+2, y))
-                        pix3 = mat.textureImg.getpixel((x*4+3, y))
-                        pixTotal = (pix3 << 12) + (pix2 << 8) + (pix1 << 4) + pix0
-                        outputFile.write(struct.pack('<H', pixTotal))
-            if not mat.packedCLUT: continue
-            colorCount = {8: 256, 4: 16}[mat.colorMode]
-            outputFile.write(struct.pack('<HHHH', colorCount, 1, mat.xPosCLUT, mat.yPosCLUT))
-            for x in range(colorCount):
-                pixRGB = mat.textureCLUT.getpixel((x, 0))
-                pixR = pixRGB[0] >> 3
-                pixG = pixRGB[1] >> 3
-                pixB = pixRGB[2] >> 3
-                pixTotal = (pixB << 10) + (pixG << 5) + (pixR)
-                outputFile.write(struct.pack('<H', pixTotal))
-        outputFile.close()
+        exportTextureBin(self.convertedMats, "./DummyPath/", "MATS1")
+    def exportZBin(self):
+        exportTextureArchive(self.convertedMats, "./DummyPath/", "MATS1")
     def exportHeader(self):
-        outputName = "level"
-        outputPath = "./DummyPath/"
-        textureFile = open(f'{outputPath}/data_textures_{outputName}.h', 'w')
-        textureFile.write(f"#ifndef texture_{outputName}_h\n#define texture_{outputName}_h\n")
-        textureFile.write('#include "types_gfx.h"\n\n')
-        # Textures
-        for matName in self.convertedMats:
-            mat = self.convertedMats[matName]
-            if mat.type != 'T': continue
-            if not mat.packed: continue
-            safeName = ''.join([char for char in matName if char.isalnum()])
-            if not safeName[0].isalpha(): safeName = "m" + safeName
-            # Texture Data
-            textureFile.write(f'unsigned short {safeName}_texture[] = {{\n\t')
-            if mat.colorMode == 15:
-                for y in range(mat.ySize):
-                    for x in range(mat.xSize):
-                        pixRGB = mat.textureImg.getpixel((x, y))
-                        pixR = pixRGB[0] >> 3
-                        pixG = pixRGB[1] >> 3
-                        pixB = pixRGB[2] >> 3
-                        pixTotal = (pixB << 10) + (pixG << 5) + (pixR)
-                        textureFile.write(f'{pixTotal}, ')
-            elif mat.colorMode == 8:
-                for y in range(mat.ySize):
-                    for x in range(mat.tpXSize):
-                        pix0 = mat.textureImg.getpixel((x*2, y))
-                        pix1 = mat.textureImg.getpixel((x*2+1, y))
-                        pixTotal = (pix1 << 8) + pix0
-                        textureFile.write(f'{pixTotal}, ')
-            elif mat.colorMode == 4:
-                for y in range(mat.ySize):
-                    for x in range(mat.tpXSize):
-                        pix0 = mat.textureImg.getpixel((x*4, y))
-                        pix1 = mat.textureImg.getpixel((x*4+1, y))
-                        pix2 = mat.textureImg.getpixel((x*4+2, y))
-                        pix3 = mat.textureImg.getpixel((x*4+3, y))
-                        pixTotal = (pix3 << 12) + (pix2 << 8) + (pix1 << 4) + pix0
-                        textureFile.write(f'{pixTotal}, ')
-            textureFile.write('\n};\n')
-            # CLUT Data
-            if not mat.packedCLUT: continue
-            textureFile.write(f'unsigned short {safeName}_CLUT[] = {{\n\t')
-            colorCount = {8: 256, 4: 16}[mat.colorMode]
-            for x in range(colorCount):
-                pixRGB = mat.textureCLUT.getpixel((x, 0))
-                pixR = pixRGB[0] >> 3
-                pixG = pixRGB[1] >> 3
-                pixB = pixRGB[2] >> 3
-                pixTotal = (pixB << 10) + (pixG << 5) + (pixR)
-                textureFile.write(f'{pixTotal}, ')
-            textureFile.write('\n};\n')
-        # Table Data
-        textureFile.write(f'\nstruct Texture DAT_TEXTURES_{outputName}[] = {{\n')
-        textureCount = 0
-        for matName in self.convertedMats:
-            mat = self.convertedMats[matName]
-            if mat.type != 'T': continue
-            if not mat.packed: continue
-            safeName = ''.join([char for char in matName if char.isalnum()])
-            if not safeName[0].isalpha(): safeName = "m" + safeName
-            textureFile.write('\t{' + f'{mat.tpXSize}, {mat.ySize}, ')
-            textureFile.write(f'{mat.xPos}, {mat.yPos}, ')
-            textureFile.write(f'{safeName}_texture' + '},\n')
-            textureCount += 1
-            if not mat.packedCLUT: continue
-            colorCount = {8: 256, 4: 16}[mat.colorMode]
-            textureFile.write('\t{' + f'{colorCount}, {1}, ')
-            textureFile.write(f'{mat.xPosCLUT}, {mat.yPosCLUT}, ')
-            textureFile.write(f'{safeName}_CLUT' + '},\n')
-            textureCount += 1
-        textureFile.write('};\n\n')
-        textureFile.write(f'#define TEXTURE_LEN_{outputName} {textureCount}\n')
-        textureFile.write('#endif\n')
-        textureFile.close()
+        exportTextureHeader(self.convertedMats, "./DummyPath/", "level")
+    def exportDump(self):
+        self.vramModel.sync(self.convertedMats)
+        self.vramModel.dump("./DummyPath/VRAM.BIN")
+    def exportBlob(self):
+        exportTextureBlob(self.convertedMats, "./DummyPath/", "level")
     def updatePage(self):
+        self.vramModel.sync(self.convertedMats)
         self.redrawList()
-        self.VRAMViewer.repaint()
+        self.VRAMViewer.update()
 
 class VRAMWidget(QWidget):
     def __init__(self, parent):
@@ -350,6 +247,11 @@ class VRAMWidget(QWidget):
         self.viewZoomScale = 1
         self.VRAMQSize = QSize(1024, 512)
         self.setFixedSize(self.VRAMQSize)
+        # Everything in VRAM is drawn once into this image, only the rects of items that changed since the
+        # last paint are drawn again
+        self.composite = QImage(self.VRAMQSize, QImage.Format_ARGB32_Premultiplied)
+        self.compositeItems = None     # Item key -> (rect, stamp) of what the composite shows
+        self.itemImages = {}            # (Item key, stamp) -> QImage of the converted texture or CLUT
     def setZoomScale(self, zoomScale):
         self.viewZoomScale = zoomScale
         self.setFixedSize(self.VRAMQSize * zoomScale)
@@ -358,41 +260,75 @@ class VRAMWidget(QWidget):
         xPos = pos.x()/self.viewZoomScale
         yPos = pos.y()/self.viewZoomScale
         print(f"Mouse clicked at: {pos.x()}, {pos.y()} relative to the widget")
-    def paintEvent(self, event):
-        painter = QPainter(self)
-        painter.scale(self.viewZoomScale, self.viewZoomScale)
-        # Draw Background
-        painter.setPen(Qt.NoPen)
-        painter.setBrush(QColor(128, 128, 128))
-        painter.drawRect(0, 0, 1024, 512)
-        # Draw Framebuffer(s)
+    def framebufferRects(self):
         bufWidth = int(self.ui.bufferWidthSelector.currentText())
         bufHeight = int(self.ui.bufferHeightSelector.currentText())
-        bufX1 = self.ui.buffer1XPosSelector.value()
-        bufY1 = self.ui.buffer1YPosSelector.value()
-        painter.setBrush(QColor(200, 100, 0))
-        painter.setPen(Qt.NoPen)
-        painter.drawRect(bufX1, bufY1, bufWidth, bufHeight)
-        painter.setPen(QPen(QColor(0, 100, 200), 3))
-        painter.drawText(bufX1+10, bufY1+20, "Frame Buffer 1")
+        rects = [QRect(self.ui.buffer1XPosSelector.value(), self.ui.buffer1YPosSelector.value(), bufWidth, bufHeight)]
         if (self.ui.doubleBufferCheck.isChecked()):
-            bufX2 = self.ui.buffer2XPosSelector.value()
-            bufY2 = self.ui.buffer2YPosSelector.value()
-            painter.setBrush(QColor(0, 100, 200))
-            painter.setPen(Qt.NoPen)
-            painter.drawRect(bufX2, bufY2, bufWidth, bufHeight)
-            painter.setPen(QPen(QColor(200, 100, 0), 3))
-            painter.drawText(bufX2+10, bufY2+20, "Frame Buffer 2")
-        # Draw Textures and CLUTs
+            rects.append(QRect(self.ui.buffer2XPosSelector.value(), self.ui.buffer2YPosSelector.value(), bufWidth, bufHeight))
+        return rects
+    def currentItems(self):
+        # Everything drawn into the composite in drawing order, the stamp changes when the pixels do
+        items = {}
+        for index, rect in enumerate(self.framebufferRects()):
+            items[('Framebuffer', index)] = (rect, None)
         for matKey in self.ui.convertedMats:
             mat = self.ui.convertedMats[matKey]
             if not mat.valid: continue
             if mat.packed:
-                rgbTexture = mat.textureImg.convert("RGBA")
-                qTexture = QImage(rgbTexture.tobytes("raw", "RGBA"), rgbTexture.width, rgbTexture.height, QImage.Format_RGBA8888)
-                qTexturePreview = qTexture.scaled(mat.tpXSize, mat.ySize)
-                painter.drawImage(mat.xPos, mat.yPos, qTexturePreview)
+                items[(matKey, 'Texture')] = (QRect(mat.xPos, mat.yPos, mat.tpXSize, mat.ySize), (mat.generation, id(mat.textureImg)))
             if mat.packedCLUT and mat.textureCLUT != None:
-                rgbCLUT = mat.textureCLUT.convert("RGBA")
-                qCLUTPreview = QImage(rgbCLUT.tobytes("raw", "RGBA"), rgbCLUT.width, rgbCLUT.height, QImage.Format_RGBA8888)
-                painter.drawImage(mat.xPosCLUT, mat.yPosCLUT, qCLUTPreview)
+                rect = QRect(mat.xPosCLUT, mat.yPosCLUT, mat.textureCLUT.width, mat.textureCLUT.height)
+                items[(matKey, 'CLUT')] = (rect, (mat.generation, id(mat.textureCLUT)))
+        return items
+    def itemImage(self, key, stamp, rect):
+        if (key, stamp) not in self.itemImages:
+            mat = self.ui.convertedMats[key[0]]
+            rgbImg = (mat.textureImg if key[1] == 'Texture' else mat.textureCLUT).convert("RGBA")
+            qImage = QImage(rgbImg.tobytes("raw", "RGBA"), rgbImg.width, rgbImg.height, QImage.Format_RGBA8888)
+            # Converting makes a deep copy so the image doesn't point into the freed bytes
+            qImage = qImage.scaled(rect.width(), rect.height()).convertToFormat(QImage.Format_ARGB32_Premultiplied)
+            self.itemImages[(key, stamp)] = qImage
+        return self.itemImages[(key, stamp)]
+    def updateComposite(self):
+        items = self.currentItems()
+        if self.compositeItems == None:
+            dirty = QRegion(0, 0, 1024, 512)
+        else:
+            dirty = QRegion()
+            for key in self.compositeItems.keys() | items.keys():
+                old = self.compositeItems.get(key)
+                new = items.get(key)
+                if old == new: continue
+                if old != None: dirty += old[0]
+                if new != None: dirty += new[0]
+        self.compositeItems = items
+        # Forget images of items that were reconverted or removed
+        self.itemImages = {imageKey: image for imageKey, image in self.itemImages.items() if imageKey[0] in items and items[imageKey[0]][1] == imageKey[1]}
+        if dirty.isEmpty(): return
+        painter = QPainter(self.composite)
+        painter.setClipRegion(dirty)
+        painter.setPen(Qt.NoPen)
+        # Draw Background
+        painter.fillRect(0, 0, 1024, 512, QColor(128, 128, 128))
+        dirtyBounds = dirty.boundingRect()
+        for key, (rect, stamp) in items.items():
+            if not rect.intersects(dirtyBounds): continue
+            # Draw Framebuffer(s)
+            if key[0] == 'Framebuffer':
+                painter.fillRect(rect, [QColor(200, 100, 0), QColor(0, 100, 200)][key[1]])
+                continue
+            # Draw Textures and CLUTs
+            painter.drawImage(rect.topLeft(), self.itemImage(key, stamp, rect))
+        painter.end()
+    def paintEvent(self, event):
+        self.updateComposite()
+        painter = QPainter(self)
+        painter.scale(self.viewZoomScale, self.viewZoomScale)
+        # Only blit the part of the composite being exposed
+        exposed = QRectF(event.rect())
+        exposed = QRectF(exposed.topLeft()/self.viewZoomScale, exposed.size()/self.viewZoomScale)
+        painter.drawImage(exposed, self.composite, exposed)
+        for index, rect in enumerate(self.framebufferRects()):
+            painter.setPen(QPen([QColor(0, 100, 200), QColor(200, 100, 0)][index], 3))
+            painter.drawText(rect.x()+10, rect.y()+20, f"Frame Buffer {index+1}")
@@ -28,6 +28,9 @@ class Ui_VRAMPacker(object):
         self.autopackAllButton = QtWidgets.QPushButton(self.autoPackerBox)
         self.autopackAllButton.setObjectName("autopackAllButton")
         self.autoPackerLayout.addWidget(self.autopackAllButton)
+        self.optimizePackButton = QtWidgets.QPushButton(self.autoPackerBox)
+        self.optimizePackButton.setObjectName("optimizePackButton")
+        self.autoPackerLayout.addWidget(self.optimizePackButton)
         self.autopackSelectedButton = QtWidgets.QPushButton(self.autoPackerBox)
         self.autopackSelectedButton.setObjectName("autopackSelectedButton")
         self.autoPackerLayout.addWidget(self.autopackSelectedButton)
@@ -74,6 +77,15 @@ class Ui_VRAMPacker(object):
         self.exportBinButton = QtWidgets.QPushButton(self.manualPositionBox)
         self.exportBinButton.setObjectName("exportBinButton")
         self.manualPositionLayout.setWidget(4, QtWidgets.QFormLayout.SpanningRole, self.exportBinButton)
+        self.exportDumpButton = QtWidgets.QPushButton(self.manualPositionBox)
+        self.exportDumpButton.setObjectName("exportDumpButton")
+        self.manualPositionLayout.setWidget(5, QtWidgets.QFormLayout.SpanningRole, self.exportDumpButton)
+        self.exportBlobButton = QtWidgets.QPushButton(self.manualPositionBox)
+        self.exportBlobButton.setObjectName("exportBlobButton")
+        self.manualPositionLayout.setWidget(6, QtWidgets.QFormLayout.SpanningRole, self.exportBlobButton)
+        self.exportZBinButton = QtWidgets.QPushButton(self.manualPositionBox)
+        self.exportZBinButton.setObjectName("exportZBinButton")
+        self.manualPositionLayout.setWidget(7, QtWidgets.QFormLayout.SpanningRole, self.exportZBinButton)
         self.formLayout_3.setLayout(0, QtWidgets.QFormLayout.LabelRole, self.manualPositionLayout)
         self.VRAMPackerLayout.addWidget(self.manualPositionBox, 1, 2, 1, 1)
         self.frameConfigBox = QtWidgets.QGroupBox(VRAMPacker)
@@ -182,6 +194,7 @@ class Ui_VRAMPacker(object):
         VRAMPacker.setWindowTitle(_translate("VRAMPacker", "Form"))
         self.autoPackerBox.setTitle(_translate("VRAMPacker", "Auto Packing"))
         self.autopackAllButton.setText(_translate("VRAMPacker", "Auto Pack All"))
+        self.optimizePackButton.setText(_translate("VRAMPacker", "Optimize Pack All"))
         self.autopackSelectedButton.setText(_translate("VRAMPacker", "Auto Pack Selected"))
         self.autopackUnpackedButton.setText(_translate("VRAMPacker", "Auto Pack Unpacked"))
         self.manualPositionBox.setTitle(_translate("VRAMPacker", "Manual Position"))
@@ -194,6 +207,9 @@ class Ui_VRAMPacker(object):
         self.viewZoomSelector.setItemText(4, _translate("VRAMPacker", "400%"))
         self.exportHeaderButton.setText(_translate("VRAMPacker", "Export as Header"))
         self.exportBinButton.setText(_translate("VRAMPacker", "Export as Bin"))
+        self.exportDumpButton.setText(_translate("VRAMPacker", "Export VRAM Dump"))
+        self.exportBlobButton.setText(_translate("VRAMPacker", "Export as Blob"))
+        self.exportZBinButton.setText(_translate("VRAMPacker", "Export as Compressed Bin"))
         self.frameConfigBox.setTitle(_translate("VRAMPacker", "Frame Buffer Setup"))
         self.buffer1XPosLabel.setText(_translate("VRAMPacker", "X Pos Buffer 1"))
         self.buffer1YPosLabel.setText(_translate("VRAMPacker", "Y Pos Buffer 1"))
@@ -1,5 +1,5 @@
 # Standard imports
-import sys, time, pickle
+import os, sys, time, pickle
 # Library imports
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import QIcon
@@ -7,6 +7,7 @@ from PyQt5.QtCore import Qt
 # Custom imports
 from BlenderState import BlenderState, BlenderStateManager
 from ConvertedMat import ConvertedMat
+from Conversion import invalidateStale
 from TextureConverter import TextureConverterTab
 from VRAMPacker import VRAMPackerTab
 from ModelExporter import ModelExporterTab
@@ -39,6 +40,9 @@ class MainWindow(QMainWindow):
         self.syncAction = QAction(QIcon('./icons/refresh.png'), 'Sync', self)
         self.syncAction.setStatusTip('Sync with Blender')
         self.syncAction.triggered.connect(self.syncBlender)
+        self.reconvertStaleAction = QAction(QIcon('./icons/refresh.png'), 'Reconvert Stale', self)
+        self.reconvertStaleAction.setStatusTip('Reconvert materials whose originals changed in Blender')
+        self.reconvertStaleAction.triggered.connect(self.reconvertStale)
         # Setup actions for saving and loading state
         self.saveAction = QAction(QIcon('./icons/save.png'), 'Save', self)
         self.saveAction.setStatusTip('Save')
@@ -52,6 +56,7 @@ class MainWindow(QMainWindow):
         self.toolbar.addAction(self.connectAction)
         self.toolbar.addAction(self.disconnectAction)
         self.toolbar.addAction(self.syncAction)
+        self.toolbar.addAction(self.reconvertStaleAction)
         spacer = QLabel('')
         spacer.setFixedWidth(50)
         self.toolbar.addWidget(spacer)
@@ -64,17 +69,34 @@ class MainWindow(QMainWindow):
         saveFile = open("./saveFile.pkl", "wb")
         pickle.dump(self.convertedMats, saveFile)
         saveFile.close()
+        # Blender state is saved alongside so the headless pipeline can run without Blender
+        blenderFile = open("./blenderState.pkl", "wb")
+        pickle.dump(self.blender.data, blenderFile)
+        blenderFile.close()
     def load(self):
         loadFile = open("./saveFile.pkl", "rb")
         self.convertedMats.clear()
         self.convertedMats.update(pickle.load(loadFile))
         loadFile.close()
+        if os.path.exists("./blenderState.pkl"):
+            blenderFile = open("./blenderState.pkl", "rb")
+            self.blender.data = pickle.load(blenderFile)
+            blenderFile.close()
+        self.textureConverter.clearCaches()
         self.updatePages()
     # Called everytime you sync with blender
     def syncBlender(self):
         self.blender.sync()
-        # TODO Invalidate converted mats which have changed originals
+        staleIDs = invalidateStale(self.blender.data, self.convertedMats)
         self.updatePages()
+        self.statusBar().showMessage(f'Synced, {len(staleIDs)} converted materials are stale')
+    def reconvertStale(self):
+        jobCount = self.textureConverter.reconvertStale()
+        if jobCount == 0:
+            self.statusBar().showMessage('No stale materials to reconvert')
+    def closeEvent(self, event):
+        self.textureConverter.thumbnails.stop()
+        super().closeEvent(event)
     def updatePages(self):
         self.textureConverter.updatePage()
         self.VRAMPacker.updatePage()
@@ -0,0 +1,54 @@
+# Standard imports
+import os, sys
+# Library imports
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# Custom imports
+from BlenderState import Object
+from ModelExport import exportModelBin, loadModelBin, modelRows, vertArray, primArray, MODEL_HEADER_DTYPE
+from test_TextureExport import makeProject
+
+VERTEX_COLORS = [[(1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)], [(0.5, 0.25, 0.125), (0.999, 0.001, 0.3), (0.2, 0.4, 0.6)],
+    [(0.1, 0.1, 0.1), (0.9, 0.9, 0.9), (0.3, 0.3, 0.3)], [(0.7, 0.6, 0.5), (0.4, 0.3, 0.2), (0.1, 0.0, 1.0)]]
+
+def makeObject(colors = []):
+    # Four tris, the third one has a material that isn't converted and is skipped. The UVs are negative,
+    # past 1 and NaN to go through every UV fix up.
+    verts = [(0.5, -0.25, 1.0), (10.0, 20.0, -30.0), (-1.5, 2.25, 0.125), (99.0, -99.0, 50.0), (0.01, 0.02, 0.03), (-0.7, 0.8, -0.9),
+        (3.3, 4.4, 5.5), (-6.6, -7.7, 8.8), (1.0, 1.0, 1.0)]
+    polys = [(0, 1, 2), (3, 4, 5), (6, 7, 8), (2, 4, 6)]
+    uvs = [[(0.0, 0.0), (1.0, 0.0), (0.5, 1.0)], [(-0.5, 0.25), (-1.25, 0.75), (0.5, -0.5)], [(1.5, 1.25), (2.0, 1.75), (1.25, 2.5)],
+        [(float('nan'), 0.5), (0.25, 0.75), (1.0, 1.0)]]
+    return Object(verts=verts, polys=polys, mats=['tex15', 'tex4', 'missing', 'tex8'], norms=[[(0, 0, 1)]*3]*4, colors=colors, uvs=uvs)
+
+def test_modelBinRoundTrip(tmp_path):
+    mats = makeProject()
+    for colors in ([], VERTEX_COLORS):
+        obj = makeObject(colors)
+        assert exportModelBin(obj, mats, tmp_path, 'MODEL') == 3
+        vertRows, primRows = modelRows(obj, mats)
+        header, verts, prims = loadModelBin(tmp_path / 'MODEL.BIN')
+        assert header['vertCount'] == 3 and header['primCount'] == 3
+        assert header['headerSize'] == header['vertOffset'] == MODEL_HEADER_DTYPE.itemsize
+        assert (tmp_path / 'MODEL.BIN').stat().st_size == header['primOffset'][1] + prims[1].nbytes
+        assert np.array_equal(verts, vertArray(vertRows))
+        assert verts['xy'][0].tolist() == [163, -81, 3276, 6553, -491, 737] and verts['z'][2].tolist() == [40, 9, 1802]
+        assert prims[0]['clut'].tolist() == [0, 16404, 16469] and prims[1]['tpage'].tolist() == [263, 5, 134]
+        for buffer in prims:
+            assert np.array_equal(buffer, primArray(primRows))
+def test_modelRowsGolden():
+    # Rows the per-poly writer modelRows replaced put in the header, alpha in vertex colors is ignored
+    mats = makeProject()
+    expectedVerts = [[0, 163, -81, 3276, 6553, -491, 737, 327, -9830, 40], [1, 32440, -32440, 3, 6, -229, 262, 16384, 9, -294],
+        [3, -491, 737, 3, 6, 1081, 1441, 40, 9, 1802]]
+    expectedPrims = [[0, 167772160, 0, 127, 127, 127, 52, 0, 17, 0, 127, 127, 127, 2, 17, 263, 127, 127, 127, 1, 16],
+        [1, 167772160, 3791651807, 127, 127, 127, 52, 10, 253, 16404, 127, 127, 127, 5, 253, 5, 127, 127, 127, 17, 254],
+        [3, 167772160, 0, 127, 127, 127, 52, 0, 8, 16469, 127, 127, 127, 1, 8, 134, 127, 127, 127, 5, 8]]
+    expectedColorPrims = [[0, 167772160, 0, 255, 0, 0, 52, 0, 17, 0, 0, 255, 0, 2, 17, 263, 0, 0, 255, 1, 16],
+        [1, 167772160, 3791651807, 127, 63, 31, 52, 10, 253, 16404, 254, 0, 76, 5, 253, 5, 51, 102, 153, 17, 254],
+        [3, 167772160, 0, 178, 153, 127, 52, 0, 8, 16469, 102, 76, 51, 1, 8, 134, 25, 0, 255, 5, 8]]
+    rgba = [[color + (0.5,) for color in polyColors] for polyColors in VERTEX_COLORS]
+    for colors, expected in (([], expectedPrims), (VERTEX_COLORS, expectedColorPrims), (rgba, expectedColorPrims)):
+        vertRows, primRows = modelRows(makeObject(colors), mats)
+        assert vertRows.tolist() == expectedVerts
+        assert primRows.tolist() == expected
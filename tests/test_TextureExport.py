@@ -0,0 +1,76 @@
+# Standard imports
+import os, sys
+# Library imports
+import numpy as np
+from PIL import Image
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# Custom imports
+from ConvertedMat import ConvertedMat
+from TextureExport import exportTextureBin, exportTextureArchive, readTextureIndex, extractTextureRecord
+
+def makeMat(matID, colorMode, xSize, ySize, xPos, yPos):
+    mat = ConvertedMat()
+    mat.id = matID
+    mat.type = 'T'
+    mat.valid = True
+    mat.colorMode = colorMode
+    mat.xSize = xSize
+    mat.ySize = ySize
+    mat.tpXSize = xSize // {4: 4, 8: 2, 15: 1}[colorMode]
+    mat.packed = True
+    mat.xPos = xPos
+    mat.yPos = yPos
+    return mat
+def indexedImg(indices):
+    indices = np.array(indices, dtype=np.uint8)
+    return Image.frombytes('P', (indices.shape[1], indices.shape[0]), indices.tobytes())
+def makeProject():
+    # A packed 4, 8 and 15-bit texture with CLUTs, plus an unpacked texture and a flat material that are skipped
+    mats = {}
+    mats['tex4'] = makeMat('tex4', 4, 8, 2, 320, 0)
+    mats['tex4'].textureImg = indexedImg(np.arange(16).reshape(2, 8))
+    mats['tex4'].textureCLUT = Image.fromarray(np.array([[(i*16, 255-i*16, i*8) for i in range(16)]], dtype=np.uint8))
+    mats['tex4'].packedCLUT = True
+    mats['tex4'].xPosCLUT, mats['tex4'].yPosCLUT = 320, 256
+    mats['tex4'].tiled = True
+    mats['tex4'].tileX, mats['tex4'].tileY = 8, 16
+    mats['tex8'] = makeMat('tex8', 8, 6, 2, 384, 8)
+    mats['tex8'].textureImg = indexedImg([[0, 17, 34, 255, 128, 1], [2, 3, 4, 5, 6, 7]])
+    clut = np.zeros((1, 256, 3), dtype=np.uint8)
+    clut[0, :4] = [(255, 255, 255), (8, 16, 24), (100, 150, 200), (7, 0, 255)]
+    mats['tex8'].textureCLUT = Image.fromarray(clut)
+    mats['tex8'].packedCLUT = True
+    mats['tex8'].xPosCLUT, mats['tex8'].yPosCLUT = 336, 257
+    mats['tex15'] = makeMat('tex15', 15, 3, 2, 448, 16)
+    mats['tex15'].textureImg = Image.fromarray(np.array([[(255, 0, 0), (0, 255, 0), (0, 0, 255)], [(8, 16, 24), (200, 100, 50), (7, 7, 7)]], dtype=np.uint8))
+    mats['unpacked'] = makeMat('unpacked', 15, 2, 1, 0, 0)
+    mats['unpacked'].textureImg = Image.fromarray(np.full((1, 2, 3), 255, dtype=np.uint8))
+    mats['unpacked'].packed = False
+    mats['flat'] = ConvertedMat()
+    mats['flat'].id = 'flat'
+    mats['flat'].type = 'F'
+    return mats
+
+def test_textureArchiveMatchesBin(tmp_path):
+    mats = makeProject()
+    exportTextureBin(mats, tmp_path, 'MATS')
+    assert exportTextureArchive(mats, tmp_path, 'MATS') == 5
+    plain = (tmp_path / 'MATS.BIN').read_bytes()
+    index = readTextureIndex(tmp_path / 'MATS.ZBIN')
+    assert len(index) == 5
+    start = 0
+    for entry in index:
+        w, h, x, y = [int(entry[field]) for field in ('w', 'h', 'x', 'y')]
+        record = plain[start:start+int(entry['rawSize'])]
+        assert record[:8] == np.array([w, h, x, y], dtype='<u2').tobytes()
+        halfwords = extractTextureRecord(tmp_path / 'MATS.ZBIN', entry)
+        assert halfwords.shape == (h, w) and halfwords.tobytes() == record[8:]
+        start += int(entry['rawSize'])
+    assert start == len(plain)
+def test_textureBinGolden(tmp_path):
+    # Output of the per-pixel writer the BIN exporter replaced, the 8-bit CLUT is black after its first four colors
+    exportTextureBin(makeProject(), tmp_path, 'MATS')
+    expected = bytes.fromhex('02000200400100001032547698badcfe1000010040010001e003a207640b260fe812aa166c1a2e1ef021b2257429362df830ba347c383e3c'
+        '0300020080010800001122ff80010203040506070001010050010101ff7f410c4c66007c')
+    expected += bytes(2*252) + bytes.fromhex('03000200c00110001f00e003007c410c99190000')
+    assert (tmp_path / 'MATS.BIN').read_bytes() == expected
@@ -0,0 +1,61 @@
+# Standard imports
+import os, sys, random
+# Library imports
+import numpy as np
+from PIL import Image
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# Custom imports
+from ConvertedMat import ConvertedMat
+from MaxRects import packRequests
+from VRAMLayout import VRAMLayout, VRAMSettings
+
+def makeMats(count, seed = 0, prefix = 'mat'):
+    # Indexed and 15-bit textures with heights off the 8 line grid, every texture different
+    rng = random.Random(seed)
+    mats = {}
+    for i in range(count):
+        mat = ConvertedMat()
+        mat.id = f'{prefix}{i}'
+        mat.type = 'T'
+        mat.valid = True
+        mat.colorMode = rng.choice([4, 8, 15])
+        mat.xSize = rng.choice([16, 32, 64])
+        mat.ySize = rng.choice([12, 20, 30, 64])
+        mat.tpXSize = mat.xSize // {4: 4, 8: 2, 15: 1}[mat.colorMode]
+        pixels = np.full((mat.ySize, mat.xSize), i % 256, dtype=np.uint8)
+        pixels[0, 0] = i // 256
+        mat.textureImg = Image.fromarray(pixels)
+        if mat.colorMode != 15:
+            mat.textureCLUT = Image.fromarray(np.full((1, {4: 16, 8: 256}[mat.colorMode], 3), i % 256, dtype=np.uint8))
+        mats[mat.id] = mat
+    return mats
+def assertTexturesOnGrid(mats):
+    packed = [mat for mat in mats.values() if mat.packed]
+    assert len(packed) != 0
+    for mat in packed:
+        assert mat.xPos % 8 == 0 and mat.yPos % 8 == 0, (mat.id, mat.xPos, mat.yPos)
+
+def test_packRequestsKeepsTexturesOnGrid():
+    rng = random.Random(1)
+    requests = [((i, 'Texture'), rng.choice([16, 32, 64]), rng.choice([12, 20, 30, 64]), 64, 8, 8) for i in range(60)]
+    requests += [((i, 'CLUT'), 16, 1, None, 16, 1) for i in range(20)]
+    for ordering in ('longestSide', 'area', 'jitter'):
+        for heuristic in ('bssf', 'blsf', 'baf', 'bl'):
+            placements, largestFree = packRequests([(0, 0, 320, 240), (0, 240, 320, 240)], requests, ordering, heuristic, seed=3)
+            assert len(placements) == len(requests)
+            for (index, itemType), (x, y) in placements.items():
+                if itemType == 'Texture': assert x % 8 == 0 and y % 8 == 0, (ordering, heuristic, x, y)
+                else: assert x % 16 == 0
+def test_autoPackAllKeepsTexturesOnGrid():
+    for strategy in ('maxRects', 'firstFit'):
+        mats = makeMats(60)
+        VRAMLayout(mats, VRAMSettings()).autoPackAll(strategy)
+        assertTexturesOnGrid(mats)
+def test_autoPackUnpackedKeepsTexturesOnGrid():
+    mats = makeMats(60)
+    layout = VRAMLayout(mats, VRAMSettings())
+    layout.autoPackAll('maxRects')
+    mats.update(makeMats(20, seed=2, prefix='new'))
+    failed = VRAMLayout(mats, VRAMSettings()).autoPackUnpacked()
+    assert len(failed) == 0 and all([mats[f'new{i}'].packed for i in range(20)])
+    assertTexturesOnGrid(mats)